@@ -300,7 +300,11 @@ def pack_string(x):
 
     # int with length of string followed by chars
 
-    u = bytes(x, 'UTF-8')
+    # names read from a file are still bytes
+    if isinstance(x, bytes):
+        u = x
+    else:
+        u = bytes(x, 'UTF-8')
     p = pack('i', len(u))
     p += u
 
@@ -327,13 +331,17 @@ class RawData:
 
     def read(self, length=None):
         if length is None:
-            return self.data
+            out = self.data
         elif length == 0:
             return b""
         else:
             out = self.data[self.addr:self.addr + length]
             self.addr += length
-            return out
+        # data may be a memoryview into a VP archive; hand out bytes so
+        # nothing downstream keeps the archive mapped
+        if isinstance(out, memoryview):
+            out = out.tobytes()
+        return out
 
     def seek(self, new_addr, whence = 0):
         if whence == 1:
@@ -0,0 +1,150 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+## BSP cache module
+## Copyright (c) 2012 by Christopher Koch
+
+"""This module contains BSPCache, an on-disk cache of packed BSP data keyed by a fingerprint of the mesh it was built from.  Exporting the same model again only has to build trees for the submodels that changed."""
+
+import hashlib
+import logging
+import os
+import tempfile
+from struct import pack, unpack
+
+# Bump this whenever the BSP compiler's output changes, so old entries
+# stop matching
+BSP_CACHE_VERSION = 1
+
+
+def _hash_floats(h, vecs):
+    flat = [c for vec in vecs for c in vec]
+    h.update(pack('<I{}f'.format(len(flat)), len(flat), *flat))
+
+
+def _hash_ints(h, lists):
+    # lengths go in too, so [[1, 2], [3]] and [[1], [2, 3]] differ
+    flat = list()
+    for l in lists:
+        flat.append(len(l))
+        flat.extend(l)
+    h.update(pack('<I{}i'.format(len(flat)), len(flat), *flat))
+
+
+def mesh_fingerprint(m):
+    """Returns a hex digest of everything in Mesh m that ends up in the BSP data:
+    verts, normals, faces, face normals and centers, UVs and texture ids.
+    Floats are hashed as the 32-bit values that will be written to the file."""
+    h = hashlib.sha1()
+    h.update(pack('<I', BSP_CACHE_VERSION))
+    _hash_floats(h, m.verts)
+    _hash_floats(h, m.vnorms)
+    _hash_ints(h, m.vnorms_by_vert)
+    _hash_ints(h, m.faces)
+    _hash_ints(h, m.fvnorms)
+    _hash_floats(h, m.fnorms)
+    _hash_floats(h, m.centers)
+    _hash_floats(h, [co for f in m.uv for co in f])
+    tex_ids = [-1 if t is None else t for t in m.tex_ids]
+    h.update(pack('<I{}i'.format(len(tex_ids)), len(tex_ids), *tex_ids))
+    return h.hexdigest()
+
+
+class BSPCache:
+
+    """A directory of packed BSP trees.  Each entry is a file named after the mesh fingerprint, holding the submodel's bounding box followed by its BSP data.  When the directory grows beyond max_size bytes, the least recently used entries are deleted.
+
+    Methods:
+        fingerprint(m) -- Returns the cache key for Mesh m.
+        get(key) -- Returns (min, max, bsp_data), or None if key isn't cached.
+        put(key, min, max, bsp_data) -- Stores an entry and evicts old ones if needed."""
+
+    def __init__(self, path=None, max_size=256 * 1024 * 1024):
+        if path is None:
+            path = os.path.join(tempfile.gettempdir(), "io_scene_pof_bsp")
+        self.path = path
+        self.max_size = max_size
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def __repr__(self):
+        return "<BSPCache at {} limited to {} bytes>".format(self.path, self.max_size)
+
+    def fingerprint(self, m):
+        return mesh_fingerprint(m)
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key + ".bsp")
+
+    def get(self, key):
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return None
+        if len(data) < 48:
+            logging.warning("Discarding truncated BSP cache entry {}".format(entry_path))
+            self._remove(entry_path)
+            return None
+        # touch it so eviction sees it as recently used
+        try:
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+        logging.debug("BSP cache hit {}".format(key))
+        return unpack('<3d', data[:24]), unpack('<3d', data[24:48]), data[48:]
+
+    def put(self, key, min_pnt, max_pnt, bsp_data):
+        entry_path = self._entry_path(key)
+        tmp_path = "{}.{}.tmp".format(entry_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(pack('<3d', *min_pnt))
+            f.write(pack('<3d', *max_pnt))
+            f.write(bsp_data)
+        os.replace(tmp_path, entry_path)
+        self._evict()
+
+    def _remove(self, entry_path):
+        try:
+            os.remove(entry_path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        entries = list()
+        total = 0
+        for name in os.listdir(self.path):
+            if not name.endswith(".bsp"):
+                continue
+            entry_path = os.path.join(self.path, name)
+            try:
+                st = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry_path))
+            total += st.st_size
+        if total <= self.max_size:
+            return
+        entries.sort()
+        for mtime, size, entry_path in entries:
+            if total <= self.max_size:
+                break
+            logging.debug("Evicting BSP cache entry {}".format(entry_path))
+            self._remove(entry_path)
+            total -= size
@@ -0,0 +1,418 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+## BSP query module
+## Copyright (c) 2012 by Christopher Koch
+
+"""This module answers batches of ray and segment queries against a submodel's BSP tree or the shield collision tree, pruning with the trees' bounding boxes.  With NumPy available, each tree node is tested against all the rays that reach it at once; otherwise rays are traced one at a time in plain Python.
+
+Usage:
+    tree = CollisionTree.from_model(pof_handler.submodels[0])
+    outside = [not i for i in tree.points_inside(gun_points)]"""
+
+from .pof import InvalidBSPError, index_bsp_tree
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Rays parallel to a box face get this instead of a zero direction, so the
+# slab test never divides by zero
+_TINY = 1e-30
+_EPSILON = 1e-9
+_INF = float('inf')
+_SKEW_DIR = (0.8017837, 0.5345225, 0.2672612)
+
+
+def _fix_dir(d):
+    return tuple(c if c > _TINY or c < -_TINY else _TINY for c in d)
+
+
+class CollisionTree:
+
+    """A flattened copy of a BSP or shield tree for ray queries.  Build one with from_model() or from_shield().
+
+    Ray directions need not be unit length; hit distances are given in units of the direction's length, so a segment from p to q is the ray p, q - p with max_dist 1.
+
+    Methods:
+        closest_hits(origins, directions, max_dist=None) -- For each ray, returns (distance, face index) of the nearest hit, or None.
+        any_hits(origins, directions, max_dist=None) -- For each ray, returns whether it hits anything.
+        segment_hits(starts, ends) -- For each segment, returns whether it crosses the geometry.
+        count_hits(origins, directions, max_dist=None) -- For each ray, returns the number of faces it crosses.
+        points_inside(points, direction=None) -- For each point, returns whether it is inside the (closed) geometry."""
+
+    def __init__(self, use_numpy=True):
+        self.use_numpy = use_numpy and numpy is not None
+        # one entry per node; bounds of None mean the node is never pruned
+        self.node_min = list()
+        self.node_max = list()
+        self.node_children = list()
+        self.node_tris = list()     # (first, last + 1) into the tri lists
+        # triangles as a corner and two edges, grouped by node
+        self.tri_v0 = list()
+        self.tri_e1 = list()
+        self.tri_e2 = list()
+        self.tri_face = list()      # poly index in bsp_tree or shield face index
+        self._arrays = None
+
+    def __repr__(self):
+        return "<CollisionTree with {} nodes and {} triangles>".format(len(self.node_min), len(self.tri_v0))
+
+    def _add_node(self, bounds):
+        self.node_min.append(bounds[0] if bounds else None)
+        self.node_max.append(bounds[1] if bounds else None)
+        self.node_children.append(list())
+        self.node_tris.append((len(self.tri_v0), len(self.tri_v0)))
+        return len(self.node_min) - 1
+
+    def _add_faces(self, node, faces, verts):
+        tri_v0 = self.tri_v0
+        tri_e1 = self.tri_e1
+        tri_e2 = self.tri_e2
+        tri_face = self.tri_face
+        first = len(tri_v0)
+        for face_idx, vert_list in faces:
+            a = verts[vert_list[0]]
+            # fan triangulation
+            for i in range(1, len(vert_list) - 1):
+                b = verts[vert_list[i]]
+                c = verts[vert_list[i + 1]]
+                tri_v0.append(a)
+                tri_e1.append((b[0] - a[0], b[1] - a[1], b[2] - a[2]))
+                tri_e2.append((c[0] - a[0], c[1] - a[1], c[2] - a[2]))
+                tri_face.append(face_idx)
+        self.node_tris[node] = (first, len(tri_v0))
+
+    @classmethod
+    def from_model(cls, model_chunk, use_numpy=True):
+        """Builds a CollisionTree from a ModelChunk's bsp_tree.  Face indices in
+        the results are indices into bsp_tree."""
+        tree = cls(use_numpy)
+        bsp_tree = model_chunk.bsp_tree
+        offsets, size = index_bsp_tree(bsp_tree)
+        verts = None
+        for block in bsp_tree:
+            if block.CHUNK_ID == 1:
+                verts = block.vert_list
+                break
+        if verts is None:
+            raise InvalidBSPError(model_chunk, "No DEFPOINTS block in BSP tree")
+
+        # each run of blocks up to a sortnorm or end block becomes a node,
+        # bounded by the run's boundbox or sortnorm
+        node_at = dict()
+        stack = [(0, None)]
+        while stack:
+            addr, parent = stack.pop()
+            if addr in node_at:
+                node = node_at[addr]
+                if parent is not None and node is not None:
+                    tree.node_children[parent].append(node)
+                continue
+            faces = list()
+            bounds = None
+            children = list()
+            start = addr
+            while addr < size:
+                try:
+                    idx = offsets[addr]
+                except KeyError:
+                    raise InvalidBSPError(addr, "Offset does not point at a block")
+                block = bsp_tree[idx]
+                if block.CHUNK_ID == 4:
+                    if bounds is None:
+                        bounds = (block.min, block.max)
+                    for offset in (block.front_offset,
+                                   block.back_offset,
+                                   block.prelist_offset,
+                                   block.postlist_offset,
+                                   block.online_offset):
+                        if offset:
+                            children.append(addr + offset)
+                    break
+                elif block.CHUNK_ID == 0:
+                    break
+                elif block.CHUNK_ID == 5 and bounds is None and not faces:
+                    bounds = (block.min, block.max)
+                elif block.CHUNK_ID in (2, 3):
+                    faces.append((idx, block.vert_list))
+                addr += len(block)
+            if not faces and not children:
+                # empty pre/post/online list
+                node_at[start] = None
+                continue
+            node = tree._add_node(bounds)
+            node_at[start] = node
+            tree._add_faces(node, faces, verts)
+            if parent is not None:
+                tree.node_children[parent].append(node)
+            for child in children:
+                stack.append((child, node))
+        return tree
+
+    @classmethod
+    def from_shield(cls, tree_chunk, shield_chunk, use_numpy=True):
+        """Builds a CollisionTree from a TreeChunk's shield_tree and the
+        ShieldChunk it indexes.  Face indices in the results are indices into
+        the shield's face_list."""
+        tree = cls(use_numpy)
+        verts = shield_chunk.vert_list
+        face_list = shield_chunk.face_list
+        shield_tree = tree_chunk.shield_tree
+        offsets, size = index_bsp_tree(shield_tree)
+        stack = [(0, None)] if shield_tree else []
+        while stack:
+            addr, parent = stack.pop()
+            try:
+                shield_node = shield_tree[offsets[addr]]
+            except KeyError:
+                raise InvalidBSPError(addr, "Offset does not point at a shield tree node")
+            node = tree._add_node((shield_node.min, shield_node.max))
+            if parent is not None:
+                tree.node_children[parent].append(node)
+            if shield_node.node_type:
+                tree._add_faces(node, [(i, face_list[i]) for i in shield_node.face_list], verts)
+            else:
+                for offset in (shield_node.back_offset, shield_node.front_offset):
+                    if offset:
+                        stack.append((addr + offset, node))
+        return tree
+
+    ## Queries ##
+
+    def closest_hits(self, origins, directions, max_dist=None):
+        if self.use_numpy:
+            return self._trace_numpy(origins, directions, max_dist, 'closest')
+        return self._trace_python(origins, directions, max_dist, 'closest')
+
+    def any_hits(self, origins, directions, max_dist=None):
+        if self.use_numpy:
+            return self._trace_numpy(origins, directions, max_dist, 'any')
+        return self._trace_python(origins, directions, max_dist, 'any')
+
+    def count_hits(self, origins, directions, max_dist=None):
+        if self.use_numpy:
+            return self._trace_numpy(origins, directions, max_dist, 'count')
+        return self._trace_python(origins, directions, max_dist, 'count')
+
+    def segment_hits(self, starts, ends):
+        directions = [(e[0] - s[0], e[1] - s[1], e[2] - s[2]) for s, e in zip(starts, ends)]
+        return self.any_hits(starts, directions, 1.0)
+
+    def points_inside(self, points, direction=None):
+        # odd number of crossings along any ray means inside.  The default
+        # direction is skewed off the axes, since a ray along an axis tends
+        # to run through the shared vertices of regular meshes and count
+        # the same crossing more than once
+        if direction is None:
+            direction = _SKEW_DIR
+        return [bool(n % 2) for n in self.count_hits(points, [direction] * len(points))]
+
+    ## Plain Python tracing, one ray at a time ##
+
+    def _trace_python(self, origins, directions, max_dist, mode):
+        node_min = self.node_min
+        node_max = self.node_max
+        node_children = self.node_children
+        node_tris = self.node_tris
+        tri_v0 = self.tri_v0
+        tri_e1 = self.tri_e1
+        tri_e2 = self.tri_e2
+        tri_face = self.tri_face
+        if max_dist is None:
+            max_dist = _INF
+        results = list()
+
+        for o, d in zip(origins, directions):
+            ox, oy, oz = o
+            dx, dy, dz = _fix_dir(d)
+            ix = 1.0 / dx
+            iy = 1.0 / dy
+            iz = 1.0 / dz
+            best = max_dist
+            best_face = None
+            hits = 0
+            stack = [0] if node_min else []
+            while stack:
+                node = stack.pop()
+                bmin = node_min[node]
+                if bmin is not None:
+                    bmax = node_max[node]
+                    t1 = (bmin[0] - ox) * ix
+                    t2 = (bmax[0] - ox) * ix
+                    if t1 > t2:
+                        t1, t2 = t2, t1
+                    tnear = t1 if t1 > 0.0 else 0.0
+                    tfar = t2 if t2 < best else best
+                    t1 = (bmin[1] - oy) * iy
+                    t2 = (bmax[1] - oy) * iy
+                    if t1 > t2:
+                        t1, t2 = t2, t1
+                    if t1 > tnear:
+                        tnear = t1
+                    if t2 < tfar:
+                        tfar = t2
+                    t1 = (bmin[2] - oz) * iz
+                    t2 = (bmax[2] - oz) * iz
+                    if t1 > t2:
+                        t1, t2 = t2, t1
+                    if t1 > tnear:
+                        tnear = t1
+                    if t2 < tfar:
+                        tfar = t2
+                    if tnear > tfar:
+                        continue
+                first, last = node_tris[node]
+                for i in range(first, last):
+                    # Moller-Trumbore, two-sided
+                    e1 = tri_e1[i]
+                    e2 = tri_e2[i]
+                    px = dy * e2[2] - dz * e2[1]
+                    py = dz * e2[0] - dx * e2[2]
+                    pz = dx * e2[1] - dy * e2[0]
+                    det = e1[0] * px + e1[1] * py + e1[2] * pz
+                    if -_EPSILON < det < _EPSILON:
+                        continue
+                    inv_det = 1.0 / det
+                    v0 = tri_v0[i]
+                    sx = ox - v0[0]
+                    sy = oy - v0[1]
+                    sz = oz - v0[2]
+                    u = (sx * px + sy * py + sz * pz) * inv_det
+                    if u < 0.0 or u > 1.0:
+                        continue
+                    qx = sy * e1[2] - sz * e1[1]
+                    qy = sz * e1[0] - sx * e1[2]
+                    qz = sx * e1[1] - sy * e1[0]
+                    v = (dx * qx + dy * qy + dz * qz) * inv_det
+                    if v < 0.0 or u + v > 1.0:
+                        continue
+                    t = (e2[0] * qx + e2[1] * qy + e2[2] * qz) * inv_det
+                    if t < _EPSILON or t > best:
+                        continue
+                    if mode == 'closest':
+                        best = t
+                        best_face = tri_face[i]
+                    elif mode == 'any':
+                        best_face = tri_face[i]
+                        stack = None
+                        break
+                    else:
+                        hits += 1
+                if stack is None:
+                    break
+                stack.extend(node_children[node])
+
+            if mode == 'closest':
+                results.append(None if best_face is None else (best, best_face))
+            elif mode == 'any':
+                results.append(best_face is not None)
+            else:
+                results.append(hits)
+        return results
+
+    ## NumPy tracing, all rays reaching a node at once ##
+
+    def _get_arrays(self):
+        if self._arrays is None:
+            n = len(self.node_min)
+            bmin = numpy.full((n, 3), -_INF)
+            bmax = numpy.full((n, 3), _INF)
+            for i in range(n):
+                if self.node_min[i] is not None:
+                    bmin[i] = self.node_min[i]
+                    bmax[i] = self.node_max[i]
+            self._arrays = (bmin, bmax,
+                            numpy.array(self.tri_v0, dtype=float).reshape(-1, 3),
+                            numpy.array(self.tri_e1, dtype=float).reshape(-1, 3),
+                            numpy.array(self.tri_e2, dtype=float).reshape(-1, 3),
+                            numpy.array(self.tri_face, dtype=numpy.int64))
+        return self._arrays
+
+    def _trace_numpy(self, origins, directions, max_dist, mode):
+        np = numpy
+        bmin, bmax, tri_v0, tri_e1, tri_e2, tri_face = self._get_arrays()
+        o = np.array(origins, dtype=float).reshape(-1, 3)
+        d = np.array(directions, dtype=float).reshape(-1, 3)
+        d = np.where(np.abs(d) > _TINY, d, _TINY)
+        inv = 1.0 / d
+        num_rays = len(o)
+        best = np.full(num_rays, _INF if max_dist is None else float(max_dist))
+        best_face = np.full(num_rays, -1, dtype=np.int64)
+        hits = np.zeros(num_rays, dtype=np.int64)
+        done = np.zeros(num_rays, dtype=bool)
+
+        stack = [(0, np.arange(num_rays))] if len(bmin) else []
+        while stack:
+            node, rays = stack.pop()
+            if mode == 'any':
+                rays = rays[~done[rays]]
+            # slab test against the node's box, clipped to the best hit so far
+            t1 = (bmin[node] - o[rays]) * inv[rays]
+            t2 = (bmax[node] - o[rays]) * inv[rays]
+            tnear = np.minimum(t1, t2).max(axis=1)
+            tfar = np.maximum(t1, t2).min(axis=1)
+            keep = np.maximum(tnear, 0.0) <= np.minimum(tfar, best[rays])
+            rays = rays[keep]
+            if not len(rays):
+                continue
+
+            first, last = self.node_tris[node]
+            if last > first:
+                # Moller-Trumbore, rays x triangles
+                rd = d[rays][:, None, :]
+                e1 = tri_e1[first:last][None, :, :]
+                e2 = tri_e2[first:last][None, :, :]
+                p = np.cross(rd, e2)
+                det = (e1 * p).sum(axis=2)
+                ok = np.abs(det) > _EPSILON
+                inv_det = np.where(ok, 1.0 / np.where(ok, det, 1.0), 0.0)
+                s = o[rays][:, None, :] - tri_v0[first:last][None, :, :]
+                u = (s * p).sum(axis=2) * inv_det
+                q = np.cross(s, e1)
+                v = (rd * q).sum(axis=2) * inv_det
+                t = (e2 * q).sum(axis=2) * inv_det
+                hit = (ok & (u >= 0.0) & (u <= 1.0) & (v >= 0.0) & (u + v <= 1.0) &
+                       (t >= _EPSILON) & (t <= best[rays][:, None]))
+                if mode == 'count':
+                    hits[rays] += hit.sum(axis=1)
+                else:
+                    t = np.where(hit, t, _INF)
+                    nearest = t.argmin(axis=1)
+                    t_min = t[np.arange(len(rays)), nearest]
+                    found = t_min < _INF
+                    hit_rays = rays[found]
+                    if mode == 'closest':
+                        better = t_min[found] < best[hit_rays]
+                        hit_rays = hit_rays[better]
+                        best[hit_rays] = t_min[found][better]
+                        best_face[hit_rays] = tri_face[first + nearest[found][better]]
+                    else:
+                        best_face[hit_rays] = tri_face[first + nearest[found]]
+                        done[hit_rays] = True
+                        rays = rays[~found]
+            for child in self.node_children[node]:
+                stack.append((child, rays))
+
+        if mode == 'closest':
+            return [None if f < 0 else (float(t), int(f)) for t, f in zip(best, best_face)]
+        elif mode == 'any':
+            return [bool(x) for x in done]
+        return [int(x) for x in hits]
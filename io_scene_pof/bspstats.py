@@ -0,0 +1,204 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+## BSP statistics module
+## Copyright (c) 2012 by Christopher Koch
+
+"""This module reports on the shape of BSP trees (ModelChunk.bsp_tree) and shield collision trees (TreeChunk.shield_tree), parsed or freshly built, and on what it cost to build them.  Useful for tuning the split strategy and for catching trees that have degenerated into long chains."""
+
+import time
+from collections import Counter
+from math import ceil, log
+from .pof import InvalidBSPError, index_bsp_tree
+
+try:
+    import tracemalloc
+except ImportError:     # Python < 3.4
+    tracemalloc = None
+
+
+def _tree_shape(stats, leaf_depths, leaf_sizes, fallback_size):
+    num_leaves = len(leaf_depths)
+    stats['leaves'] = num_leaves
+    if num_leaves:
+        stats['max_depth'] = max(leaf_depths)
+        stats['avg_depth'] = sum(leaf_depths) / num_leaves
+    else:
+        stats['max_depth'] = 0
+        stats['avg_depth'] = 0.0
+    # depth relative to a perfectly balanced tree with the same leaves;
+    # long chains show up as large values here
+    if num_leaves > 1:
+        stats['balance'] = stats['max_depth'] / ceil(log(num_leaves, 2))
+    else:
+        stats['balance'] = 1.0
+    stats['leaf_histogram'] = dict(Counter(leaf_sizes))
+    stats['fallback_leaves'] = len([n for n in leaf_sizes if n >= fallback_size])
+    return stats
+
+
+def bsp_tree_stats(bsp_tree, fallback_size=3):
+    """Returns a dict describing a ModelChunk.bsp_tree.
+
+    Keys:
+        size -- packed size of the BSP data in bytes
+        sortnorms, boundboxes, polys, end_blocks -- block counts
+        leaves -- number of polygon lists reached from the root
+        max_depth, avg_depth -- sortnorm levels above each leaf
+        balance -- max_depth divided by the depth of a balanced tree
+        leaf_histogram -- dict of polys per leaf : number of leaves
+        fallback_leaves -- leaves with at least fallback_size polys.  The
+            compiler only makes those when it gives up splitting and dumps
+            the polys into an unordered list."""
+    offsets, size = index_bsp_tree(bsp_tree)
+    counts = Counter(block.CHUNK_ID for block in bsp_tree)
+    stats = {'size': size,
+             'sortnorms': counts[4],
+             'boundboxes': counts[5],
+             'polys': counts[2] + counts[3],
+             'end_blocks': counts[0]}
+
+    leaf_depths = list()
+    leaf_sizes = list()
+    visited = set()
+    stack = [(0, 0)]
+    while stack:
+        addr, depth = stack.pop()
+        if addr in visited:
+            continue
+        visited.add(addr)
+        # blocks run on until a sortnorm or an end block, like the engine does
+        num_polys = 0
+        while True:
+            try:
+                block = bsp_tree[offsets[addr]]
+            except KeyError:
+                raise InvalidBSPError(addr, "Offset does not point at a block")
+            if block.CHUNK_ID == 4:
+                for offset in (block.front_offset,
+                               block.back_offset,
+                               block.prelist_offset,
+                               block.postlist_offset,
+                               block.online_offset):
+                    if offset:
+                        stack.append((addr + offset, depth + 1))
+                break
+            elif block.CHUNK_ID == 0:
+                break
+            elif block.CHUNK_ID in (2, 3):
+                num_polys += 1
+            addr += len(block)
+            if addr >= size:
+                break
+        if num_polys:
+            leaf_depths.append(depth)
+            leaf_sizes.append(num_polys)
+
+    return _tree_shape(stats, leaf_depths, leaf_sizes, fallback_size)
+
+
+def shield_tree_stats(shield_tree, fallback_size=3):
+    """Returns a dict describing a TreeChunk.shield_tree, with the same keys as
+    bsp_tree_stats() except that splits and leaves are counted instead of
+    BSP blocks.  Split offsets are relative to the start of the split."""
+    offsets, size = index_bsp_tree(shield_tree)
+    stats = {'size': size + 4,     # plus the tree size field
+             'splits': len([n for n in shield_tree if not n.node_type]),
+             'polys': sum(len(n.face_list) for n in shield_tree if n.node_type)}
+
+    leaf_depths = list()
+    leaf_sizes = list()
+    stack = [(0, 0)] if shield_tree else []
+    visited = set()
+    while stack:
+        addr, depth = stack.pop()
+        if addr in visited:
+            continue
+        visited.add(addr)
+        try:
+            node = shield_tree[offsets[addr]]
+        except KeyError:
+            raise InvalidBSPError(addr, "Offset does not point at a shield tree node")
+        if node.node_type:
+            leaf_depths.append(depth)
+            leaf_sizes.append(len(node.face_list))
+        else:
+            for offset in (node.front_offset, node.back_offset):
+                if offset:
+                    stack.append((addr + offset, depth + 1))
+
+    return _tree_shape(stats, leaf_depths, leaf_sizes, fallback_size)
+
+
+def measure_build(build, *args, **kwargs):
+    """Calls build(*args, **kwargs) and returns its result along with a dict of
+    the wall time in seconds and the peak Python memory allocated during the
+    call in bytes (None if tracemalloc isn't available)."""
+    tracing = tracemalloc is not None and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    elif tracemalloc is not None and hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        result = build(*args, **kwargs)
+    finally:
+        wall_time = time.perf_counter() - start
+        if tracemalloc is not None:
+            peak = tracemalloc.get_traced_memory()[1]
+            if tracing:
+                tracemalloc.stop()
+        else:
+            peak = None
+    return result, {'wall_time': wall_time, 'peak_memory': peak}
+
+
+def submodel_stats(chunk, m=None, **kwargs):
+    """Returns bsp_tree_stats() for a ModelChunk.  If Mesh m is given, the tree
+    is first rebuilt from it with chunk.set_mesh(m, **kwargs), and the build's
+    wall_time and peak_memory are included."""
+    cost = dict()
+    if m is not None:
+        cost = measure_build(chunk.set_mesh, m, **kwargs)[1]
+    stats = bsp_tree_stats(chunk.bsp_tree)
+    stats.update(cost)
+    return stats
+
+
+def shield_stats(tree_chunk, shield_chunk=None):
+    """Returns shield_tree_stats() for a TreeChunk.  If a ShieldChunk is given,
+    the tree is first rebuilt from it and the build cost is included."""
+    cost = dict()
+    if shield_chunk is not None:
+        cost = measure_build(tree_chunk.make_shield_collision_tree, shield_chunk)[1]
+    stats = shield_tree_stats(tree_chunk.shield_tree)
+    stats.update(cost)
+    return stats
+
+
+def format_stats(stats):
+    """Returns stats as lines of text, one key per line."""
+    lines = list()
+    for key in sorted(stats):
+        value = stats[key]
+        if key == 'leaf_histogram':
+            value = ", ".join("{}: {}".format(k, value[k]) for k in sorted(value))
+        elif isinstance(value, float):
+            value = "{:.4g}".format(value)
+        lines.append("{:16} {}".format(key, value))
+    return "\n".join(lines)
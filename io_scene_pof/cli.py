@@ -0,0 +1,309 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+## Command line module
+## Copyright (c) 2012 by Christopher Koch
+
+"""This module is the command line front end, run as python -m io_scene_pof.  The pof module is only imported once a command runs, so --help and bad arguments come back right away."""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+VERSIONS = (2116, 2117)
+
+
+def _read(path):
+    """Returns the PolyModel in the POF file at path, which may be inside a VP
+    archive."""
+    from . import pof, vp
+    archive_path, member = vp.split_vp_path(path)
+    if member is None:
+        with open(path, 'rb') as pof_file:
+            return pof.read_pof(pof_file)
+    with vp.VPArchive(archive_path) as archive:
+        return pof.read_pof(archive.open(member))
+
+
+def _text(b):
+    return b.decode('UTF-8', 'replace') if isinstance(b, bytes) else b
+
+
+## Commands ##
+# Each takes a path and the parsed arguments and returns a result that can be
+# pickled back from a worker process.  Printing is left to the matching
+# _print_* function, so output from several files doesn't interleave.
+
+
+def info(path, args):
+    pm = _read(path)
+    header = pm.header
+    result = {'version': pm.pof_ver,
+              'chunks': sorted(pm.chunks),
+              'radius': header.max_radius,
+              'detail_levels': list(header.sobj_detail_levels),
+              'debris': list(header.sobj_debris),
+              'submodels': [(i, _text(pm.submodels[i].name), pm.submodels[i].parent_id)
+                            for i in sorted(pm.submodels)],
+              }
+    if 'TXTR' in pm.chunks:
+        result['textures'] = [_text(t) for t in pm.chunks['TXTR'].textures]
+    return result
+
+
+def _print_info(path, result):
+    print("{}: POF {}, {} submodels, radius {:.2f}".format(path, result['version'],
+                                                          len(result['submodels']),
+                                                          result['radius']))
+    print("  chunks: {}".format(" ".join(result['chunks'])))
+    print("  detail levels: {}  debris: {}".format(result['detail_levels'], result['debris']))
+    for model_id, name, parent_id in result['submodels']:
+        print("  {:4} {:24} parent {}".format(model_id, name, parent_id))
+    if 'textures' in result:
+        print("  textures: {}".format(", ".join(result['textures'])))
+
+
+def validate(path, args):
+    """Returns a list of problems: chunks the header doesn't add up with, and
+    submodels whose BSP data doesn't parse.  Anything else that goes wrong is
+    a bug, not a problem with the file, and is raised."""
+    from struct import error as StructError
+    from . import pof
+    problems = list()
+    pm = _read(path)
+    try:
+        pm.verify_pof()
+    except pof.VolitionError as e:
+        problems.append(str(e))
+    for model_id in sorted(pm.submodels):
+        sobj = pm.submodels[model_id]
+        try:
+            sobj.get_polygons()
+        except (pof.VolitionError, StructError) as e:
+            # StructError is BSP data that runs past the end of the chunk
+            problems.append("submodel {} ({}): {}".format(model_id, _text(sobj.name), e))
+    return problems
+
+
+def _print_validate(path, result):
+    if not result:
+        print("{}: OK".format(path))
+    for problem in result:
+        print("{}: {}".format(path, problem))
+
+
+def _output_path(path, args, ext):
+    name = os.path.splitext(os.path.basename(path))[0] + ext
+    return os.path.join(args.output_dir, name)
+
+
+def convert(path, args):
+    from . import pof
+    pm = _read(path)
+    out_path = _output_path(path, args, ".pof")
+    if os.path.abspath(out_path) == os.path.abspath(path):
+        raise ValueError("refusing to overwrite the input file, give another --output-dir")
+    pof_data = pof.write_pof(pm, args.version)
+    with open(out_path, 'wb') as f:
+        f.write(pof_data)
+    return out_path
+
+
+def _print_convert(path, result):
+    print("{} -> {}".format(path, result))
+
+
+def _jsonable(value):
+    from array import array
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, bytes):
+        return _text(value)
+    if isinstance(value, (list, tuple, array)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, dict):
+        return {str(_text(k)): _jsonable(v) for k, v in value.items()}
+    return _object_dict(value)
+
+
+def _object_dict(obj):
+    attrs = dict()
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            if hasattr(obj, name):
+                attrs[name] = getattr(obj, name)
+    attrs.update(getattr(obj, '__dict__', {}))
+    out = dict()
+    for name, value in attrs.items():
+        # BSP trees are the bulk of a file and unreadable as JSON anyway
+        if name.startswith('_') or name == 'bsp_data':
+            continue
+        out[name] = _jsonable(value)
+    if 'bsp_data' in attrs:
+        out['bsp_size'] = len(obj._get_bsp_data())
+    return out
+
+
+def dump_json(path, args):
+    pm = _read(path)
+    result = {'file': path,
+              'version': pm.pof_ver,
+              'chunks': {key: _object_dict(chunk) for key, chunk in pm.chunks.items()},
+              'submodels': [_object_dict(pm.submodels[i]) for i in sorted(pm.submodels)],
+              }
+    text = json.dumps(result, indent=1, sort_keys=True)
+    if args.output_dir is None:
+        return text
+    out_path = _output_path(path, args, ".json")
+    with open(out_path, 'w') as f:
+        f.write(text)
+    return out_path
+
+
+def _print_dump_json(path, result):
+    print(result)
+
+
+def _buildable_mesh(sobj):
+    """Returns sobj's mesh with the normals get_mesh() leaves out, since the
+    importer doesn't need them but the BSP compiler does."""
+    from array import array
+    from . import pof
+    m = sobj.get_mesh(arrays=True)
+    defpoints = [block for block in sobj.bsp_tree if block.CHUNK_ID == 1][0]
+    polys = sobj.get_polygons()
+    # polygons index the normals as written, vert by vert, not the
+    # deduplicated list the defpoints block keeps
+    vnorms = list()
+    vnorms_by_vert = list()
+    for norm_ids in defpoints.vnorms_by_vert:
+        vnorms_by_vert.append(list(range(len(vnorms), len(vnorms) + len(norm_ids))))
+        vnorms.extend(defpoints.vnorms[n] for n in norm_ids)
+    m.vnorms = vnorms
+    m.vnorms_by_vert = vnorms_by_vert
+    m.fvnorms = pof.RaggedView(array('i', polys.norm_ids), polys.starts)
+    m.calc_face_metrics()
+    return m
+
+
+def bench(path, args):
+    """Times reading the file, decoding every submodel, rebuilding every BSP
+    tree and writing the file back out."""
+    from . import pof
+    from .bspstats import measure_build
+    cost = dict()
+    pm, cost['read'] = measure_build(_read, path)
+    meshes, cost['decode'] = measure_build(
+        lambda: [_buildable_mesh(sobj) for sobj in pm.submodels.values()])
+    if not args.no_build:
+        cost['build'] = measure_build(
+            lambda: [sobj.set_mesh(m, jobs=args.build_jobs)
+                     for sobj, m in zip(pm.submodels.values(), meshes)])[1]
+    cost['write'] = measure_build(pof.write_pof, pm, pm.pof_ver)[1]
+    return cost
+
+
+def _print_bench(path, result):
+    print(path)
+    for step in ('read', 'decode', 'build', 'write'):
+        if step not in result:
+            continue
+        peak = result[step]['peak_memory']
+        peak = "" if peak is None else ", peak {:.1f} MB".format(peak / 1048576)
+        print("  {:8} {:8.3f} sec{}".format(step, result[step]['wall_time'], peak))
+
+
+COMMANDS = {'info': (info, _print_info),
+            'validate': (validate, _print_validate),
+            'convert': (convert, _print_convert),
+            'dump-json': (dump_json, _print_dump_json),
+            'bench': (bench, _print_bench),
+            }
+
+
+def _run(command, path, args):
+    # module level so worker processes can unpickle it
+    try:
+        return True, COMMANDS[command][0](path, args)
+    except Exception as e:
+        logging.debug("{} failed on {}".format(command, path), exc_info=True)
+        return False, "{}: {}".format(type(e).__name__, e)
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="python -m io_scene_pof",
+                                     description="Inspect and convert POF files without Blender.  "
+                                     "Paths may point inside VP archives, like "
+                                     "models.vp/data/models/ship.pof.")
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help="log more (repeat for debug output)")
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('files', nargs='+', metavar='FILE')
+    common.add_argument('-j', '--jobs', type=int, default=1,
+                        help="process this many files at once")
+
+    subparsers.add_parser('info', parents=[common], help="summarize each file")
+    subparsers.add_parser('validate', parents=[common],
+                          help="check headers and BSP data; exits 1 if anything is wrong")
+    p = subparsers.add_parser('convert', parents=[common], help="rewrite as another POF version")
+    p.add_argument('--version', type=int, choices=VERSIONS, required=True)
+    p.add_argument('-o', '--output-dir', default='.')
+    p = subparsers.add_parser('dump-json', parents=[common], help="dump the chunks as JSON")
+    p.add_argument('-o', '--output-dir', default=None,
+                   help="write FILE.json here instead of to stdout")
+    p = subparsers.add_parser('bench', parents=[common],
+                              help="time reading, decoding, BSP building and writing")
+    p.add_argument('--no-build', action='store_true', help="skip rebuilding BSP trees")
+    p.add_argument('--build-jobs', type=int, default=1,
+                   help="worker processes for each BSP build")
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+    if args.command is None:
+        make_parser().print_help()
+        return 2
+    logging.basicConfig(level=(logging.WARNING, logging.INFO, logging.DEBUG)[min(args.verbose, 2)],
+                        format="%(levelname)s: %(message)s")
+
+    command = args.command
+    if args.jobs > 1 and len(args.files) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(args.jobs) as executor:
+            results = executor.map(_run, [command] * len(args.files), args.files,
+                                   [args] * len(args.files))
+            results = list(results)
+    else:
+        results = [_run(command, path, args) for path in args.files]
+
+    status = 0
+    print_result = COMMANDS[command][1]
+    for path, (ok, result) in zip(args.files, results):
+        if not ok:
+            print("{}: {}".format(path, result), file=sys.stderr)
+            status = 1
+        else:
+            print_result(path, result)
+            if command == 'validate' and result:
+                status = 1
+    return status
@@ -26,78 +26,115 @@ http://code.google.com/p/blender-pof-support/wiki/ExportScript
 """
 
 
+import multiprocessing
 import os
 import time
+from array import array
 import bpy
 import bmesh
 import mathutils
 from collections import OrderedDict
 from bpy_extras.io_utils import unpack_list, unpack_face_list
 from . import pof
+from . import export_worker
 
 
-def create_mesh(bm, fore_is_y, bmats):
-    """Takes a Blender mesh and returns a Volition mesh."""
+def create_mesh(bm, fore_is_y, bmats, weld_distance=0.0, weld_normal_distance=0.0):
+    """Takes a Blender mesh and returns a Volition mesh.
+
+    Verts closer than weld_distance and normals of the same vert closer
+    than weld_normal_distance are merged; with 0, only identical ones are."""
     # Mesh will be added to SOBJ chunk somewhere else
-    bm.calc_tessface()
-    m = pof.Mesh()
-    verts = list()
+    m = pof.ArrayMesh()
+
+    # pull everything out of Blender in bulk, one foreach_get per attribute
+    num_verts = len(bm.vertices)
+    num_loops = len(bm.loops)
+    num_polys = len(bm.polygons)
+    co_data = array('f', [0.0]) * (3 * num_verts)
+    no_data = array('f', [0.0]) * (3 * num_verts)
+    bm.vertices.foreach_get('co', co_data)
+    bm.vertices.foreach_get('normal', no_data)
+    loop_verts = array('i', [0]) * num_loops
+    bm.loops.foreach_get('vertex_index', loop_verts)
+    loop_starts = array('i', [0]) * num_polys
+    loop_totals = array('i', [0]) * num_polys
+    mat_indices = array('i', [0]) * num_polys
+    bm.polygons.foreach_get('loop_start', loop_starts)
+    bm.polygons.foreach_get('loop_total', loop_totals)
+    bm.polygons.foreach_get('material_index', mat_indices)
+
+    coords = list(zip(co_data[0::3], co_data[1::3], co_data[2::3]))
+    normals = list(zip(no_data[0::3], no_data[1::3], no_data[2::3]))
+    verts, bvert_verts = pof.weld_points(coords, weld_distance)
+    norm_list, bvert_norm_ids = pof.weld_points(normals, weld_normal_distance)
+    if weld_distance > 0 or weld_normal_distance > 0:
+        num_coords = len(set(coords))
+        num_pairs = len(set(zip(coords, normals)))
+
+    # normals belong to verts in a POF, each vert lists its own, and
+    # polys index them in the order they're written out vert by vert
+    norms_by_vert = [list() for v in verts]
+    vert_norm_index = dict()
+    bvert_norm_keys = list()
+    for i, v in enumerate(bvert_verts):
+        key = (v, bvert_norm_ids[i])
+        if key not in vert_norm_index:
+            vert_norm_index[key] = len(norms_by_vert[v])
+            norms_by_vert[v].append(bvert_norm_ids[i])
+        bvert_norm_keys.append(key)
     vnorms = list()
     vnorms_by_vert = list()
-    for v in bm.vertices:
-        co = tuple(v.co)
-        vn = tuple(v.normal)
-        if co not in verts:
-            verts.append(co)
-            vnorms_by_vert.append(list())
-        if vn not in vnorms:
-            vnorms.append(vn)
-            vnorms_by_vert[verts.index(co)].append(len(vnorms) - 1)
-
-    # creating the face list might be slow, have to do a lot of index()'ing
-    faces = list()
-    fvnorms = list()
-    centers = list()
-    tex_ids = list()
-    fnorms = list()
-    for f in bm.polygons:
-        this_face = list()
-        these_norms = list()
-        these_verts = list()
-        for v in f.vertices:
-            this_coord = tuple(bm.vertices[v].co)
-            these_verts.append(this_coord)
-            this_norm = tuple(bm.vertices[v].normal)
-            this_vert = verts.index(this_coord)
-            this_face.append(this_vert)
-            these_norms.append(vnorms.index(this_norm))
-        faces.append(this_face)
-        fvnorms.append(these_norms)
-        centers.append(pof.vavg(these_verts)) 
-        # in case not all mats are linked to mesh:
-        if bmats is not None and len(bm.materials) > 0:
-            tex_ids.append(bmats.index(bm.materials[f.material_index].name))
-        fnorms.append(tuple(f.normal))
-
-    if bmats is not None and len(bm.tessface_uv_textures) > 0:
-        uvtex = bm.tessface_uv_textures[0]
-        uv = list()
-        for i, tf in enumerate(uvtex.data):
-            if len(faces[i]) == 3:
-                uv.append([tf.uv1, tf.uv2, tf.uv3])
-            else:
-                uv.append([tf.uv1, tf.uv2, tf.uv3, tf.uv4])
-        m.uv = uv
+    first_norm = list()
+    for these_norms in norms_by_vert:
+        first_norm.append(len(vnorms))
+        vnorms_by_vert.append(list(range(len(vnorms), len(vnorms) + len(these_norms))))
+        vnorms.extend([norm_list[n] for n in these_norms])
+    bvert_norms = [first_norm[v] + vert_norm_index[(v, n)] for v, n in bvert_norm_keys]
+
+    if weld_distance > 0 or weld_normal_distance > 0:
+        print("\tWelded {} verts into {} and {} normals into {}".format(
+              num_coords, len(verts), num_pairs, len(vnorms)))
+
+    if bmats is not None:
+        uv_loops = array('f', [0.0]) * (2 * num_loops)
+        if len(bm.uv_layers) > 0:
+            bm.uv_layers[0].data.foreach_get('uv', uv_loops)
+
+    # gather corners poly by poly, Blender doesn't promise the loops are
+    # in polygon order
+    corner_verts = [bvert_verts[v] for v in loop_verts]
+    corner_norms = [bvert_norms[v] for v in loop_verts]
+    face_data = array('i')
+    fvnorm_data = array('i')
+    uv_data = array('f')
+    face_starts = array('i', [0])
+    for s, n in zip(loop_starts, loop_totals):
+        face_data.extend(corner_verts[s:s + n])
+        fvnorm_data.extend(corner_norms[s:s + n])
+        if bmats is not None:
+            uv_data.extend(uv_loops[2 * s:2 * (s + n)])
+        face_starts.append(len(face_data))
+
+    # in case not all mats are linked to mesh:
+    tex_ids = array('i', [-1]) * num_polys
+    if bmats is not None and len(bm.materials) > 0:
+        mat_ids = dict((name, i) for i, name in enumerate(bmats))
+        slot_ids = [mat_ids.get(mat.name, -1) if mat is not None else -1 for mat in bm.materials]
+        tex_ids = array('i', [slot_ids[i] for i in mat_indices])
+
+    if bmats is not None:
+        m.uv = pof.RaggedView(uv_data, face_starts, 2)
         m.flip_v()
 
     m.verts = verts
     m.vnorms = vnorms
     m.vnorms_by_vert = vnorms_by_vert
-    m.faces = faces
-    m.fvnorms = fvnorms
-    m.centers = centers
-    m.tex_ids = tex_ids
-    m.fnorms = fnorms
+    m.faces = pof.RaggedView(face_data, face_starts)
+    m.fvnorms = pof.RaggedView(fvnorm_data, face_starts)
+    m.tex_ids = pof.OptionalIntView(tex_ids)
+    # centers and face normals, all faces at once
+    m.calc_face_metrics()
 
     if fore_is_y:
         m.flip_yz()
@@ -132,19 +169,21 @@ def make_eye_chunk(eye_objs, fore_is_y, submodels):
     eye_offsets = list()
     eye_normals = list()
     for eye in eye_objs:
-        eye_sobj_nums.append(submodels.index(eye.parent)
-        loc = eye.location
+        eye_sobj_nums.append(submodels.index(eye.parent))
+        loc = tuple(eye.location)
         if fore_is_y:
-            loc = (loc[0], loc[2], loc[1])
-            znorm = mathutils.Vector((0,0,1))
+            loc = pof.swap_yz(loc)
+            this_norm = mathutils.Vector((0,0,1))
         else:
-            znorm = mathutils.Vector((0,1,0))
+            this_norm = mathutils.Vector((0,1,0))
         eye_offsets.append(loc)
-        this_norm = znorm.rotate(eye.rotation_quaternion).normalize()
+        # rotate() and normalize() work in place and return None
+        this_norm.rotate(eye.rotation_quaternion)
+        this_norm.normalize()
         if fore_is_y:
-            eye_normals.append(this_norm.xzy)
+            eye_normals.append(tuple(this_norm.xzy))
         else:
-            eye_normals.append(this_norm)
+            eye_normals.append(tuple(this_norm))
     
     this_chunk.sobj_num = eye_sobj_nums
     this_chunk.eye_offset = eye_offsets
@@ -153,12 +192,105 @@ def make_eye_chunk(eye_objs, fore_is_y, submodels):
     return this_chunk
     
     
-def make_thrust_chunk(thruster_objs):
-    pass
-    
-    
-def make_path_chunk(path_objs):
-    pass
+def read_point_mesh(obj, fore_is_y):
+    """Returns the points, normals and radii of a vertex-only helper mesh made
+    by the importer.  Verts added since get a zero normal (visible from all
+    sides) and the last radius."""
+    me = obj.data
+    num_points = len(me.vertices)
+    co = array('f', [0.0]) * (3 * num_points)
+    me.vertices.foreach_get('co', co)
+    points = list(zip(co[0::3], co[1::3], co[2::3]))
+    flat_norms = list(obj.get('POF normals', []))
+    norms = list(zip(flat_norms[0::3], flat_norms[1::3], flat_norms[2::3]))
+    norms.extend([(0.0, 0.0, 0.0)] * (num_points - len(norms)))
+    radii = list(obj.get('POF radii', []))
+    if radii:
+        radii.extend([radii[-1]] * (num_points - len(radii)))
+    else:
+        radii = [1.0] * num_points
+    if fore_is_y:
+        points = [pof.swap_yz(p) for p in points]
+        norms = [pof.swap_yz(n) for n in norms]
+    return points, norms[:num_points], radii[:num_points]
+
+
+def make_thrust_chunk(thruster_objs, fore_is_y):
+    this_chunk = pof.FuelChunk()
+    thruster_properties = list()
+    glow_pos = list()
+    glow_norm = list()
+    glow_radius = list()
+    for obj in thruster_objs:
+        points, norms, radii = read_point_mesh(obj, fore_is_y)
+        thruster_properties.append(obj.get('Properties', ''))
+        glow_pos.append(points)
+        glow_norm.append(norms)
+        glow_radius.append(radii)
+    this_chunk.thruster_properties = thruster_properties
+    this_chunk.glow_pos = glow_pos
+    this_chunk.glow_norm = glow_norm
+    this_chunk.glow_radius = glow_radius
+    return this_chunk
+
+
+def make_glow_chunk(glow_objs, fore_is_y, submodels):
+    this_chunk = pof.GlowChunk()
+    for attr in ('disp_time', 'on_time', 'off_time', 'parent_id', 'properties',
+                 'glow_points', 'glow_norms', 'glow_radius'):
+        setattr(this_chunk, attr, list())
+    for obj in glow_objs:
+        points, norms, radii = read_point_mesh(obj, fore_is_y)
+        this_chunk.disp_time.append(obj.get('Displacement time', 0))
+        this_chunk.on_time.append(obj.get('On time', 0))
+        this_chunk.off_time.append(obj.get('Off time', 0))
+        if obj.parent in submodels:
+            this_chunk.parent_id.append(submodels.index(obj.parent))
+        else:
+            this_chunk.parent_id.append(-1)
+        this_chunk.properties.append(obj.get('Properties', ''))
+        this_chunk.glow_points.append(points)
+        this_chunk.glow_norms.append(norms)
+        this_chunk.glow_radius.append(radii)
+    return this_chunk
+
+
+def make_path_chunk(path_objs, fore_is_y):
+    this_chunk = pof.PathChunk()
+    path_names = list()
+    path_parents = list()
+    vert_list = list()
+    vert_rad = list()
+    turret_sobj_num = list()
+    for obj in path_objs:
+        spline = obj.data.splines[0]
+        num_points = len(spline.points)
+        co = array('f', [0.0]) * (4 * num_points)
+        radii = array('f', [0.0]) * num_points
+        spline.points.foreach_get('co', co)
+        spline.points.foreach_get('radius', radii)
+        points = list(zip(co[0::4], co[1::4], co[2::4]))
+        if fore_is_y:
+            points = [pof.swap_yz(p) for p in points]
+        counts = list(obj.get('Turret counts', []))
+        counts.extend([0] * (num_points - len(counts)))
+        flat_turrets = list(obj.get('Turrets', []))
+        turrets = list()
+        k = 0
+        for n in counts[:num_points]:
+            turrets.append(flat_turrets[k:k + n])
+            k += n
+        path_names.append(obj.name.encode())
+        path_parents.append(obj.get('Parent', '').encode())
+        vert_list.append(points)
+        vert_rad.append(list(radii))
+        turret_sobj_num.append(turrets)
+    this_chunk.path_names = path_names
+    this_chunk.path_parents = path_parents
+    this_chunk.vert_list = vert_list
+    this_chunk.vert_rad = vert_rad
+    this_chunk.turret_sobj_num = turret_sobj_num
+    return this_chunk
     
     
 def make_dock_chunk(dock_objs):
@@ -207,12 +339,12 @@ def make_hdr_chunk(scene, detail_list, debris_list, mass_ctr, flash_objs):
     if ('Inertia-0' in scene.values() and 
         'Inertia-1' in scene.values() and 
         'Inertia-2' in scene.values()):
-        hdr_chunk.inertia_tensor = [scene['Inertia-0'], scene['Inertia-1'], scene['Inertia-2']]
+        hdr_chunk.inertia_tensor = [tuple(scene['Inertia-{}'.format(i)]) for i in range(3)]
     else:
-        hdr_chunk.inertia_tensor = [[0,0,0] * 3]
+        hdr_chunk.inertia_tensor = [(0,0,0)] * 3
         
     if mass_ctr is not None:
-        hdr_chunk.mass_center = mass_ctr.location
+        hdr_chunk.mass_center = tuple(mass_ctr.location)
     else:
         hdr_chunk.mass_center = (0,0,0)
         
@@ -224,7 +356,7 @@ def make_hdr_chunk(scene, detail_list, debris_list, mass_ctr, flash_objs):
     hdr_chunk.light_locations = list()
     hdr_chunk.light_types = list()
     for obj in flash_objs:
-        hdr_chunk.light_locations.append(obj.location)
+        hdr_chunk.light_locations.append(tuple(obj.location))
         if 'Muzzleflash type' in obj.values():
             hdr_chunk.light_types.append(obj['Muzzleflash type'])
         else:
@@ -233,7 +365,17 @@ def make_hdr_chunk(scene, detail_list, debris_list, mass_ctr, flash_objs):
     return hdr_chunk
 
 
-def export(operator, context, filepath,
+def export(operator, context, filepath, **kwargs):
+    """Exports the scene to filepath in one go.  Takes the same options as
+    make_export_job()."""
+    # the BSP builder's worker processes have to be started with Python,
+    # not with Blender
+    multiprocessing.set_executable(bpy.app.binary_path_python)
+    export_worker.run_job(make_export_job(operator, context, filepath, **kwargs))
+    return {'FINISHED'}
+
+
+def make_export_job(operator, context, filepath,
             export_header_data=True,
             export_acen=True,
             fore_is_y=True,
@@ -251,8 +393,15 @@ def export(operator, context, filepath,
             export_tgun_points=True,
             export_tmis_points=True,
             export_flash_points=True,
+            use_bsp_cache=True,
+            weld_distance=0.0,
+            weld_normal_distance=0.0,
+            jobs=1,
             ):
-    
+    """Collects everything Blender knows about the model into a dict for
+    export_worker.run_job(): the finished helper chunks, the submodel chunks
+    and the meshes their BSP trees still have to be built from.  Nothing in
+    it refers to bpy, so it can be pickled and handed to another process."""
     filepath = os.fsencode(filepath)
     if not os.path.isfile(filepath):
         # file doesn't already exist, export everything
@@ -304,6 +453,10 @@ def export(operator, context, filepath,
     mass_ctr = None
     chunk_list = list()
     submodel_chunks = list()
+    # (chunk, mesh) pairs whose trees the worker builds, and (chunk, chunk)
+    # pairs of submodels sharing a mesh datablock
+    builds = list()
+    shares = list()
     bmats = list()
     
     lods = list()
@@ -317,7 +470,18 @@ def export(operator, context, filepath,
         # go through all objects in scene and assign to lists by name
         name = obj.name.lower()
         helper = obj.type == 'EMPTY'
-        if name.startswith('eye') and helper:
+        # point clouds and curves made by the importer
+        point_helper = obj.get('POF helper')
+        if point_helper == 'thruster' and obj.type == 'MESH':
+            print("Found thruster: " + obj.name)
+            thruster_objs.append(obj)
+        elif point_helper == 'glow' and obj.type == 'MESH':
+            print("Found glow bank: " + obj.name)
+            glow_objs.append(obj)
+        elif point_helper == 'path' and obj.type == 'CURVE':
+            print("Found path: " + obj.name)
+            path_objs.append(obj)
+        elif name.startswith('eye') and helper:
             print("Found eye: " + obj.name)
             eye_objs.append(obj)
         elif name.startswith('thrust') and helper:
@@ -386,23 +550,32 @@ def export(operator, context, filepath,
         if export_geometry:
             if shield is not None:
                 shield_chunk = pof.ShieldChunk()
-                shield_mesh = create_mesh(shield.data, fore_is_y, None)
-                shield_chunk.set_mesh(shield_mesh)
+                shield_mesh = create_mesh(shield.data, fore_is_y, None,
+                                          weld_distance, weld_normal_distance)
+                builds.append((shield_chunk, shield_mesh))
                 chunk_list.append(shield_chunk)
+            # submodels sharing a mesh datablock (turret copies, usually)
+            # share one BSP tree
+            built = dict()
             for i, obj in enumerate(submodels):
-                mesh = create_mesh(obj.data, fore_is_y, bmats)
-                #mesh.obj_ctr = obj.location
                 this_chunk = make_sobj_chunk(obj)
                 if obj.parent is not None:
                     this_chunk.parent_id = submodels.index(obj.parent)
                 else:
                     this_chunk.parent_id = -1
-                this_chunk.offset = obj.location    # fore is y?
+                this_chunk.offset = tuple(obj.location)    # fore is y?
                 if 'POF model ID' in obj.values():
                     this_chunk.model_id = obj['POF model ID']
                 else:
                     this_chunk.model_id = i
-                this_chunk.set_mesh(mesh)
+                if obj.data.name in built:
+                    shares.append((this_chunk, built[obj.data.name]))
+                else:
+                    mesh = create_mesh(obj.data, fore_is_y, bmats,
+                                       weld_distance, weld_normal_distance)
+                    #mesh.obj_ctr = obj.location
+                    builds.append((this_chunk, mesh))
+                    built[obj.data.name] = this_chunk
                 submodel_chunks.append(this_chunk)
         else:
             for i, obj in enumerate(submodels):
@@ -417,14 +590,24 @@ def export(operator, context, filepath,
     if export_eye_points:
         eye_chunk = make_eye_chunk(eye_objs, fore_is_y, submodels)
         chunk_list.append(eye_chunk)
+
+    # only the point cloud kind of thrusters, glows and paths can be
+    # exported so far, empties don't say which thruster or bank they're in
+    thruster_objs = [obj for obj in thruster_objs if obj.type == 'MESH']
+    glow_objs = [obj for obj in glow_objs if obj.type == 'MESH']
+    path_objs = [obj for obj in path_objs if obj.type == 'CURVE']
+    if export_thruster_points and thruster_objs:
+        chunk_list.append(make_thrust_chunk(thruster_objs, fore_is_y))
+    if export_glow_points and glow_objs:
+        chunk_list.append(make_glow_chunk(glow_objs, fore_is_y, submodels))
+    if export_paths and path_objs:
+        chunk_list.append(make_path_chunk(path_objs, fore_is_y))
     
-    if pof_handler is None:
-        pof_handler = pof.PolyModel(chunk_list + submodel_chunks)
-    else:
-        pof_handler.update_pof(chunk_list, submodel_chunks)
-    pof_data = pof.write_pof(pof_handler)
-    pof_file = open(filepath, 'wb')
-    pof_file.write(pof_data)
-    pof_file.close
-    
-    return {'FINISHED'}
\ No newline at end of file
+    return {'filepath': filepath,
+            'pof_handler': pof_handler,
+            'chunk_list': chunk_list,
+            'submodel_chunks': submodel_chunks,
+            'builds': builds,
+            'shares': shares,
+            'use_bsp_cache': use_bsp_cache,
+            'jobs': jobs}
\ No newline at end of file
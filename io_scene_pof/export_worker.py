@@ -0,0 +1,131 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+## Export worker module
+## Copyright (c) 2012 by Christopher Koch
+
+"""This module runs the half of a POF export that doesn't need Blender: building BSP trees for the meshes export_pof.make_export_job() collected, then verifying and writing the file.  Run it as python -m io_scene_pof.export_worker JOB_FILE to do that in a process of its own; it reports on stdout, one line per step."""
+
+import builtins
+import os
+import pickle
+import sys
+import tempfile
+import time
+from . import pof
+from .bspcache import BSPCache
+
+
+def run_job(job, progress=None):
+    """Builds, verifies and writes the POF described by job, a dict made by
+    export_pof.make_export_job().  If given, progress(fraction, message) is
+    called after each step."""
+    if progress is None:
+        progress = lambda fraction, message: None
+    if job['use_bsp_cache']:
+        bsp_cache = BSPCache()
+    else:
+        bsp_cache = None
+
+    builds = job['builds']
+    for i, (chunk, m) in enumerate(builds):
+        cur_time = time.time()
+        if isinstance(chunk, pof.ModelChunk):
+            chunk.set_mesh(m, jobs=job['jobs'], cache=bsp_cache)
+        else:
+            chunk.set_mesh(m)
+        progress((i + 1) / (len(builds) + 1),
+                 "built {} in {:.2f} sec".format(chunk.CHUNK_ID.decode(), time.time() - cur_time))
+    for chunk, source in job['shares']:
+        chunk.share_bsp(source)
+
+    pof_handler = job['pof_handler']
+    if pof_handler is None:
+        pof_handler = pof.PolyModel(job['chunk_list'] + job['submodel_chunks'])
+    else:
+        pof_handler.update_pof(job['chunk_list'], job['submodel_chunks'])
+    pof_data = pof.write_pof(pof_handler)
+    with open(job['filepath'], 'wb') as pof_file:
+        pof_file.write(pof_data)
+    progress(1.0, "wrote {} bytes".format(len(pof_data)))
+
+
+# Blender's own modules; a job holding anything from these can't be loaded
+# outside Blender
+_BLENDER_MODULES = ('bpy', 'bpy_types', 'bmesh', 'mathutils', 'idprop')
+_BUILTIN_TYPES = frozenset([t for t in vars(builtins).values() if isinstance(t, type)] +
+                           [type(None)])
+
+
+def _from_blender(cls):
+    module = cls.__module__
+    if module == 'builtins':
+        # Blender's C types (Vector, IDPropertyArray...) don't all name a
+        # module, so anything claiming to be a builtin has to really be one
+        return cls not in _BUILTIN_TYPES
+    return module.split('.')[0] in _BLENDER_MODULES
+
+
+class _JobPickler(pickle.Pickler):
+    # persistent_id() sees every object on its way into the pickle
+    def persistent_id(self, obj):
+        if _from_blender(type(obj)):
+            raise pickle.PicklingError("export job holds a {}.{} from Blender: {!r}".format(
+                type(obj).__module__, type(obj).__name__, obj))
+        return None
+
+
+def write_job(job):
+    """Pickles job to a temporary file and returns its path.  Raises
+    pickle.PicklingError if anything in it comes from Blender."""
+    fd, job_path = tempfile.mkstemp(prefix="io_scene_pof_job_", suffix=".pickle")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            _JobPickler(f, pickle.HIGHEST_PROTOCOL).dump(job)
+    except Exception:
+        os.remove(job_path)
+        raise
+    return job_path
+
+
+def main(argv):
+    if len(argv) != 1:
+        print("usage: python -m io_scene_pof.export_worker JOB_FILE", file=sys.stderr)
+        return 2
+    job_path = argv[0]
+    try:
+        with open(job_path, 'rb') as f:
+            job = pickle.load(f)
+        # report lines are tagged so the operator can tell them from
+        # anything else that ends up on stdout
+        run_job(job, lambda fraction, message: print("progress {:.4f} {}".format(fraction, message),
+                                                     flush=True))
+    except Exception as e:
+        print("error {}".format(e), flush=True)
+        return 1
+    finally:
+        try:
+            os.remove(job_path)
+        except OSError:
+            pass
+    print("done", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -28,10 +28,12 @@ http://code.google.com/p/blender-pof-support/wiki/ImportScript
 
 import os
 import time
+from array import array
 import bpy
 import mathutils
-from bpy_extras.io_utils import unpack_list, unpack_face_list
 from . import pof
+from . import textures
+from . import vp
 
 
 ## For texturing:
@@ -41,66 +43,167 @@ from . import pof
 # active UV layer.  All you have to do is assign each face a material.
 
 
-def create_mesh(sobj, use_smooth_groups, fore_is_y, import_textures):
-    """Takes a submodel and adds a Blender mesh."""
-    m = sobj.get_mesh()
-    
+def new_empty(name, draw_type, location, size=None):
+    """Returns a new empty, not yet linked to any scene."""
+    obj = bpy.data.objects.new(name, None)
+    obj.empty_draw_type = draw_type
+    obj.location = location
+    if size is not None:
+        obj.empty_draw_size = size
+    return obj
+
+
+def create_point_mesh(name, points, norms, radii, fore_is_y):
+    """Returns a new vertex-only mesh object with a vert for each point, not
+    yet linked to any scene.  Normals and radii are kept per vert in the
+    'POF normals' and 'POF radii' custom properties."""
+    co = array('f')
+    flat_norms = list()
+    for p, n in zip(points, norms):
+        if fore_is_y:
+            p = pof.swap_yz(p)
+            n = pof.swap_yz(n)
+        co.extend(p)
+        flat_norms.extend(n)
+    me = bpy.data.meshes.new("{}-points".format(name))
+    me.vertices.add(len(points))
+    me.vertices.foreach_set('co', co)
+    me.update()
+    obj = bpy.data.objects.new(name, me)
+    if points:
+        obj['POF normals'] = flat_norms
+        obj['POF radii'] = list(radii)
+    return obj
+
+
+def create_path_curve(name, points, radii, fore_is_y):
+    """Returns a new curve object with one poly spline through the points,
+    not yet linked to any scene.  Each point's radius is its path radius."""
+    co = array('f')
+    for p in points:
+        if fore_is_y:
+            p = pof.swap_yz(p)
+        co.extend(p)
+        co.append(1.0)
+    cu = bpy.data.curves.new("{}-curve".format(name), 'CURVE')
+    cu.dimensions = '3D'
+    spline = cu.splines.new('POLY')
+    spline.points.add(len(points) - 1)
+    spline.points.foreach_set('co', co)
+    spline.points.foreach_set('radius', radii)
+    return bpy.data.objects.new(name, cu)
+
+
+def prepare_mesh(sobj, fore_is_y, flip_v):
+    """Returns a submodel's geometry as a pof.ArrayMesh, flipped the way
+    Blender wants it.  Doesn't touch bpy, so it can run in another thread."""
+    m = sobj.get_mesh(arrays=True)
     if fore_is_y:
         m.flip_yz()
+    if flip_v:
+        m.flip_v()
+    return m
+
+
+def prepare_meshes(pof_handler, fore_is_y, flip_v):
+    """Returns a dict of model id : prepare_mesh() for every submodel, plus
+    'shield' for the shield mesh.  Submodels with identical BSP data get the
+    same ArrayMesh.  Also safe outside the main thread."""
+    meshes = dict()
+    by_fingerprint = dict()
+    for model_id, sobj in pof_handler.submodels.items():
+        key = sobj.geometry_fingerprint()
+        if key not in by_fingerprint:
+            by_fingerprint[key] = prepare_mesh(sobj, fore_is_y, flip_v)
+        meshes[model_id] = by_fingerprint[key]
+    if 'SHLD' in pof_handler.chunks:
+        meshes['shield'] = prepare_mesh(pof_handler.chunks['SHLD'], fore_is_y, False)
+    return meshes
+
+
+def create_mesh(sobj, use_smooth_groups, fore_is_y, import_textures, mesh_cache=None, m=None):
+    """Takes a submodel and adds a Blender mesh.  If mesh_cache is a dict, a
+    mesh already made for a submodel with identical BSP data is linked to the
+    new object instead of being built again.  m is the submodel's
+    prepare_mesh(), if that's already been done."""
+    if mesh_cache is not None:
+        key = sobj.geometry_fingerprint()
+        if key in mesh_cache:
+            me, invisible_faces = mesh_cache[key]
+            return _new_mesh_object(sobj, me, use_smooth_groups, invisible_faces)
+
+    if m is None:
+        m = prepare_mesh(sobj, fore_is_y, bool(import_textures))
 
     me = bpy.data.meshes.new("{}-mesh".format(sobj.name.decode()))
 
-    vert_list = m.verts
-    face_list = m.faces
-    me.vertices.add(len(vert_list))
-    me.vertices.foreach_set('co', unpack_list(vert_list))
-    me.tessfaces.add(len(face_list))
-    me.tessfaces.foreach_set('vertices_raw', unpack_face_list(face_list))
+    # build the whole mesh through the polygon/loop API, one foreach_set
+    # per attribute
+    face_starts = m.face_starts
+    num_faces = len(face_starts) - 1
+    me.vertices.add(len(m.verts))
+    me.vertices.foreach_set('co', m.vert_data)
+    me.loops.add(len(m.face_data))
+    me.loops.foreach_set('vertex_index', m.face_data)
+    me.polygons.add(num_faces)
+    me.polygons.foreach_set('loop_start', face_starts[:-1])
+    me.polygons.foreach_set('loop_total', array('i', [face_starts[i + 1] - face_starts[i]
+                                                      for i in range(num_faces)]))
 
     invisible_faces = 0
 
     if import_textures:
-        m.flip_v()
-        uvtex = me.tessface_uv_textures.new()
-        uvtex.name = me.name
-        for n, tf in enumerate(m.uv):
-            uv_data = uvtex.data[n]
-            uv_data.uv1 = tf[0]
-            uv_data.uv2 = tf[1]
-            uv_data.uv3 = tf[2]
-            if len(tf) == 4:
-                uv_data.uv4 = tf[3]
-            if m.tex_ids[n] is not None:
-                tex_slot = import_textures[m.tex_ids[n]].texture_slots[0]
-            else:
-                tex_slot = None
+        uvtex = me.uv_textures.new(name=me.name)
+        me.uv_layers[uvtex.name].data.foreach_set('uv', m.uv_data)
+        for mat in import_textures:
+            me.materials.append(mat)
+        tex_ids = m.tex_ids.data
+        me.polygons.foreach_set('material_index', array('i', [max(t, 0) for t in tex_ids]))
+
+        # face images are pointers, no way around setting them one by one
+        images = list()
+        for mat in import_textures:
+            tex_slot = mat.texture_slots[0]
             if tex_slot is not None:
-                uv_data.image = tex_slot.texture.image
+                images.append(tex_slot.texture.image)
+            else:
+                images.append(None)
+        uv_faces = uvtex.data
+        for i, t in enumerate(tex_ids):
+            image = images[t] if t >= 0 else None
+            if image is not None:
+                uv_faces[i].image = image
             else:
                 invisible_faces += 1
-        for mat in import_textures:
-            me.materials.append(mat)
-        for i, f in enumerate(me.tessfaces):
-            if m.tex_ids[n] is not None:
-                f.material_index = m.tex_ids[i]
         uvtex.active = True
         uvtex.active_render = True
 
-    # index edges in a dict by a frozenset of the vert coords
-    # that way we don't have to worry about messed up indicies when
-    # adding the seams for smoothgroups (an edge might be [v1, v2] or [v2, v1])
     me.update(calc_edges=True)
     if use_smooth_groups:
-        m.calc_sharp()
-        for e in me.edges:
-            v1 = tuple(me.vertices[e.vertices[0]].co)
-            v2 = tuple(me.vertices[e.vertices[1]].co)
-            this_edge = (v1, v2)
-            this_edge = frozenset(this_edge)
-            e.use_edge_sharp = m.edges[this_edge]
-        for f in me.polygons:
-            f.use_smooth = True
-
+        # Blender numbers its edges its own way, so map each one to the
+        # POF mesh's edge with the same verts (an edge might be [v1, v2]
+        # or [v2, v1]), then set all the flags at once
+        sharp = m.calc_sharp()
+        edge_index = m.get_adjacency().edge_index
+        edge_verts = [0] * (2 * len(me.edges))
+        me.edges.foreach_get('vertices', edge_verts)
+        use_edge_sharp = list()
+        for i in range(0, len(edge_verts), 2):
+            a = edge_verts[i]
+            b = edge_verts[i + 1]
+            if a > b:
+                a, b = b, a
+            e = edge_index.get((a, b))
+            use_edge_sharp.append(e is not None and bool(sharp[e]))
+        me.edges.foreach_set('use_edge_sharp', use_edge_sharp)
+        me.polygons.foreach_set('use_smooth', [True] * num_faces)
+
+    if mesh_cache is not None:
+        mesh_cache[key] = (me, invisible_faces)
+    return _new_mesh_object(sobj, me, use_smooth_groups, invisible_faces)
+
+
+def _new_mesh_object(sobj, me, use_smooth_groups, invisible_faces):
     bobj = bpy.data.objects.new("Mesh", me)
     bobj['POF model id'] = sobj.model_id
     bobj.name = sobj.name.decode()
@@ -112,7 +215,84 @@ def create_mesh(sobj, use_smooth_groups, fore_is_y, import_textures):
     return bobj
 
 
-def load(operator, context, filepath,
+def find_pof_images():
+    """Returns a dict of (absolute path, fingerprint) : image for the images
+    loaded by earlier imports."""
+    images = dict()
+    for img in bpy.data.images:
+        fingerprint = img.get('POF fingerprint')
+        if fingerprint is not None:
+            path = os.fsencode(os.path.normpath(bpy.path.abspath(img.filepath)))
+            images[(path, fingerprint)] = img
+    return images
+
+
+def load_image(path, image_cache):
+    """Returns an image for the file at path.  If image_cache has one loaded
+    from the same file with the same contents, that's reused."""
+    path = os.path.normpath(os.path.abspath(path))
+    key = (path, textures.file_fingerprint(path))
+    img = image_cache.get(key)
+    if img is None:
+        img = bpy.data.images.load(path)
+        if vp.is_extracted(path):
+            # the extracted copy is deleted on exit, keep it in the .blend
+            img.pack()
+        img['POF fingerprint'] = key[1]
+        image_cache[key] = img
+    return img
+
+
+def material_key(tex_name, imgs):
+    """Returns a string identifying the material made for texture tex_name
+    from images imgs (None for missing maps)."""
+    fingerprints = list()
+    for img in imgs:
+        if img is None:
+            fingerprints.append('-')
+        else:
+            fingerprints.append(img['POF fingerprint'])
+    return "{}:{}".format(tex_name.decode('UTF-8', 'replace'), ",".join(fingerprints))
+
+
+def find_pof_materials():
+    """Returns a dict of material_key() : material for the materials made by
+    earlier imports."""
+    materials = dict()
+    for mat in bpy.data.materials:
+        mat_key = mat.get('POF material')
+        if mat_key is not None:
+            materials[mat_key] = mat
+    return materials
+
+
+def read_model(filepath):
+    """Reads the POF file at filepath, which may be inside a VP archive (see
+    vp.split_vp_path()).  Returns the PolyModel and the VPArchive it came
+    from, still open, or None."""
+    filepath = os.fsencode(filepath)
+    archive_path, member = vp.split_vp_path(filepath)
+    if member is not None:
+        archive = vp.VPArchive(archive_path)
+        return pof.read_pof(archive.open(member)), archive
+    pof_file = open(filepath, 'rb')
+    pof_handler = pof.read_pof(pof_file)
+    pof_file.close()
+    return pof_handler, None
+
+
+def load(operator, context, filepath, **kwargs):
+    """Imports the POF file at filepath in one go.  Takes the same options as
+    load_steps()."""
+    for progress in load_steps(operator, context, filepath, **kwargs):
+        pass
+    return {'FINISHED'}
+
+
+def load_steps(operator, context, filepath,
+        pof_handler=None,
+        archive=None,
+        meshes=None,
         use_smooth_groups=False,
         import_eye_points=True,
         import_paths=True,
@@ -139,17 +319,24 @@ def load(operator, context, filepath,
         import_textures=False,
         texture_path="/../maps/",
         texture_format=".dds",
-        pretty_materials=False
+        pretty_materials=False,
+        helpers_as_points=False
         ):
-    
-    print("\tloading POF file {}...".format(filepath))
+    """Imports the POF file at filepath, yielding the fraction done after
+    each step so the caller can spread the work out.  The file may already
+    have been read with read_model() and its meshes decoded with
+    prepare_meshes(), off the main thread; pass the results as pof_handler,
+    archive and meshes."""
     filepath = os.fsencode(filepath)
-    cur_time = time.time()
-    pof_file = open(filepath, 'rb')
-    pof_handler = pof.read_pof(pof_file)
-    pof_file.close()
-    new_time = time.time()
-    print("\ttime to load POF handler {} sec".format(new_time - cur_time))
+    if pof_handler is None:
+        print("\tloading POF file {}...".format(filepath))
+        cur_time = time.time()
+        # a path like mod.vp/data/models/ship.pof reads straight out of the archive
+        pof_handler, archive = read_model(filepath)
+        new_time = time.time()
+        print("\ttime to load POF handler {} sec".format(new_time - cur_time))
+    if meshes is None:
+        meshes = dict()
 
     # we now have a PolyModel instance containing all the chunks
     # now we check through the kwargs and call the appropriate
@@ -180,7 +367,11 @@ def load(operator, context, filepath,
     texture_path = os.path.normpath(os.path.dirname(filepath) + texture_path)
     print(texture_path)
 
-    if not os.path.isdir(texture_path):
+    if archive is not None:
+        archives = [archive]
+    else:
+        archives = []
+    if not os.path.isdir(texture_path) and not archives:
         print("Given texture path is not a valid directory.")
         import_textures = False
 
@@ -189,16 +380,26 @@ def load(operator, context, filepath,
         # go through txtr_chunk, make Blender images for each
         # if pretty_textures: get shine, normal, glow, etc., too
         missing_textures = 0
-        bmats = list()
+        resolver = textures.TextureResolver([texture_path], texture_format,
+                                            archives=archives)
+        if pretty_materials:
+            suffixes = (b'', b'-shine', b'-normal', b'-glow')
+        else:
+            suffixes = (b'',)
+        names = [tex + suffix for tex in txtr_chunk.textures for suffix in suffixes]
+        # one listing of the directory and a concurrent header check
+        # instead of a stat per map
+        tex_paths = resolver.resolve(names)
+        image_cache = find_pof_images()
         bimgs = list()
         if pretty_materials:
             shine_imgs = list()
             norm_imgs = list()
             glow_imgs = list()
-        for tex in txtr_chunk.textures:
-            tex_path = os.path.join(texture_path, tex + texture_format)
-            if os.path.isfile(tex_path):
-                bimgs.append(bpy.data.images.load(tex_path))
+        for i, tex in enumerate(txtr_chunk.textures):
+            these_paths = tex_paths[i * len(suffixes):(i + 1) * len(suffixes)]
+            if these_paths[0] is not None:
+                bimgs.append(load_image(these_paths[0], image_cache))
             elif tex == b'invisible':
                 bimgs.append(None)
             else:
@@ -206,33 +407,20 @@ def load(operator, context, filepath,
                 bimgs.append(None)
                 missing_textures += 1
             if pretty_materials:
-                shine_name = tex + b"-shine" + texture_format
-                norm_name = tex + b"-normal" + texture_format
-                glow_name = tex + b"-glow" + texture_format
-                shine_path = os.path.join(texture_path, shine_name)
-                norm_path = os.path.join(texture_path, norm_name)
-                glow_path = os.path.join(texture_path, glow_name)
-                if os.path.isfile(shine_path):
-                    shine_imgs.append(bpy.data.images.load(shine_path))
-                else:
-                    shine_imgs.append(None)
-                    print("Missing texture {}".format(shine_path))
-                    missing_textures += 1
-                if os.path.isfile(norm_path):
-                    norm_imgs.append(bpy.data.images.load(norm_path))
-                else:
-                    norm_imgs.append(None)
-                    print("Missing texture {}".format(norm_path))
-                    missing_textures += 1
-                if os.path.isfile(glow_path):
-                    glow_imgs.append(bpy.data.images.load(glow_path))
-                else:
-                    glow_imgs.append(None)
-                    print("Missing texture {}".format(glow_path))
-                    missing_textures += 1
+                for suffix, tex_path, imgs in zip(suffixes[1:], these_paths[1:],
+                                                  (shine_imgs, norm_imgs, glow_imgs)):
+                    if tex_path is not None:
+                        imgs.append(load_image(tex_path, image_cache))
+                    else:
+                        imgs.append(None)
+                        print("Missing texture {}".format(tex + suffix))
+                        missing_textures += 1
         print("Total missing textures: {}".format(missing_textures))
         #if missing_textures > 0:    # change this later
             #import_textures = False
+    if archive is not None:
+        # anything Blender needed from it has been extracted by now
+        archive.close()
 
     # Create a material for each texture listed in the chunk
     # Each object has its own UV layer with the base texture
@@ -244,9 +432,19 @@ def load(operator, context, filepath,
     # each object's UV layer has the same name
 
     if import_textures:
-        # for each img, make a texture and material
+        # for each img, make a texture and material, unless an earlier
+        # import already made one from the same files
+        material_cache = find_pof_materials()
         bmats = list()
         for i, img in enumerate(bimgs):
+            if pretty_materials:
+                mat_imgs = (img, shine_imgs[i], norm_imgs[i], glow_imgs[i])
+            else:
+                mat_imgs = (img,)
+            mat_key = material_key(txtr_chunk.textures[i], mat_imgs)
+            if mat_key in material_cache:
+                bmats.append(material_cache[mat_key])
+                continue
             if img is None:
                 this_mat = bpy.data.materials.new('invisible')
                 this_mat.alpha = 1.0
@@ -301,12 +499,18 @@ def load(operator, context, filepath,
                         mat_glow.blend_type = 'ADD'
                         mat_glow.use = True
 
+            this_mat['POF material'] = mat_key
+            material_cache[mat_key] = this_mat
             bmats.append(this_mat)
     else:
         bmats = False
 
     # Now submodels
+    num_steps = len(pof_handler.submodels) + 1
+    yield 0.0
 
+    # identical turret bases, barrels etc. share one mesh
+    mesh_cache = dict()
     new_objects = dict()    # dict instead of list so
                             # we can ref by POF model id
     # for testing UV mapping:
@@ -317,40 +521,40 @@ def load(operator, context, filepath,
         # get first detail level
         hull_id = pof_hdr.sobj_detail_levels[0]
         hull = pof_handler.submodels[hull_id]
-        hull_obj = create_mesh(hull, use_smooth_groups, fore_is_y, bmats)
+        hull_obj = create_mesh(hull, use_smooth_groups, fore_is_y, bmats, mesh_cache, meshes.get(hull_id))
         new_objects[hull_id] = hull_obj
         scene.objects.link(hull_obj)
+        yield len(new_objects) / num_steps
 
         # get children
         child_ids = dict()
         for model in pof_handler.submodels.values():
             if model.parent_id == hull_id:
-                child_obj = create_mesh(model, use_smooth_groups, fore_is_y, bmats)
+                child_obj = create_mesh(model, use_smooth_groups, fore_is_y, bmats, mesh_cache, meshes.get(model.model_id))
                 child_obj.parent = hull_obj
                 if fore_is_y:
-                    off_x = model.offset[0]
-                    off_y = model.offset[1]
-                    off_z = model.offset[2]
-                    child_obj.location = (off_x, off_z, off_y)
+                    child_obj.location = pof.swap_yz(model.offset)
                 else:
                     child_obj.location = model.offset
                 new_objects[model.model_id] = child_obj
                 scene.objects.link(child_obj)
+                yield len(new_objects) / num_steps
 
         # get second children
         for model in pof_handler.submodels.values():
             if model.parent_id in child_ids:
-                child_obj = create_mesh(model, use_smooth_groups, fore_is_y, bmats)
+                child_obj = create_mesh(model, use_smooth_groups, fore_is_y, bmats, mesh_cache, meshes.get(model.model_id))
                 child_obj.parent = new_objects[model.parent_id]
                 x_off = pof_handler.submodels[model.parent_id].offset[0] + model.offset[0]
                 y_off = pof_handler.submodels[model.parent_id].offset[1] + model.offset[1]
                 z_off = pof_handler.submodels[model.parent_id].offset[2] + model.offset[2]
                 if fore_is_y:
-                    child_obj.location = (x_off, z_off, y_off)
+                    child_obj.location = pof.swap_yz((x_off, y_off, z_off))
                 else:
                     child_obj.location = (x_off, y_off, z_off)
                 new_objects[model.model_id] = child_obj
                 scene.objects.link(child_obj)
+                yield len(new_objects) / num_steps
 
     else:
         layer_count = 0
@@ -361,10 +565,11 @@ def load(operator, context, filepath,
             # TODO get children!
             for i in pof_hdr.sobj_detail_levels:
                 model = pof_handler.submodels[i]
-                this_obj = create_mesh(model, use_smooth_groups, fore_is_y, bmats)
+                this_obj = create_mesh(model, use_smooth_groups, fore_is_y, bmats, mesh_cache, meshes.get(model.model_id))
                 # put LODs on sep layers from each other
                 new_objects[model.model_id] = this_obj
                 scene.objects.link(this_obj)
+                yield len(new_objects) / num_steps
                 this_obj.layers[layer_count] = True
                 if layer_count:
                     this_obj.layers[0] = False
@@ -375,10 +580,11 @@ def load(operator, context, filepath,
         if import_debris:
             for i in pof_hdr.sobj_debris:
                 model = pof_handler.submodels[i]
-                this_obj = create_mesh(model, use_smooth_groups, fore_is_y, bmats)
+                this_obj = create_mesh(model, use_smooth_groups, fore_is_y, bmats, mesh_cache, meshes.get(model.model_id))
                 # put debris on sep layer from LODs, but same as each other
                 new_objects[model.model_id] = this_obj
                 scene.objects.link(this_obj)
+                yield len(new_objects) / num_steps
                 this_obj.layers[layer_count] = True
                 if layer_count:
                     this_obj.layers[0] = False
@@ -391,130 +597,179 @@ def load(operator, context, filepath,
                 tchunk = pof_handler.chunks["TGUN"]
                 for i in range(len(tchunk.base_sobj)):
                     model = pof_handler.submodels[tchunk.base_sobj[i]]
-                    this_obj = create_mesh(model, use_smooth_groups, fore_is_y, bmats)
+                    this_obj = create_mesh(model, use_smooth_groups, fore_is_y, bmats, mesh_cache, meshes.get(model.model_id))
                     if main_detail is not None:
                         this_obj.parent = main_detail
                     off_x = model.offset[0]
                     off_y = model.offset[1]
                     off_z = model.offset[2]
                     if fore_is_y:
-                        this_obj.location = (off_x, off_z, off_y)
+                        this_obj.location = pof.swap_yz((off_x, off_y, off_z))
                     else:
                         this_obj.location = (off_x, off_y, off_z)
 
                     if tchunk.barrel_sobj[i] > -1:
                         bar_model = pof_handler.submodels[tchunk.barrel_sobj[i]]
-                        barrel_obj = create_mesh(bar_model, use_smooth_groups, fore_is_y, bmats)
+                        barrel_obj = create_mesh(bar_model, use_smooth_groups, fore_is_y, bmats, mesh_cache, meshes.get(bar_model.model_id))
                         barrel_obj.parent = this_obj
                         off_x += model.offset[0]
                         off_y += model.offset[1]
                         off_z += model.offset[2]
                         if fore_is_y:
-                            barrel_obj.location = (off_x, off_z, off_y)
+                            barrel_obj.location = pof.swap_yz((off_x, off_y, off_z))
                         else:
                             barrel_obj.location = (off_x, off_y, off_z)
                         new_objects[bar_model.model_id] = barrel_obj
                         scene.objects.link(barrel_obj)
                     new_objects[model.model_id] = this_obj
                     scene.objects.link(this_obj)
+                    yield len(new_objects) / num_steps
 
             if "TMIS" in pof_handler.chunks:
                 tchunk = pof_handler.chunks["TMIS"]
                 for i in range(len(tchunk.base_sobj)):
                     model = pof_handler.submodels[tchunk.base_sobj[i]]
-                    this_obj = create_mesh(model, use_smooth_groups, fore_is_y, bmats)
+                    this_obj = create_mesh(model, use_smooth_groups, fore_is_y, bmats, mesh_cache, meshes.get(model.model_id))
                     if main_detail is not None:
                         this_obj.parent = main_detail
                     off_x = model.offset[0]
                     off_y = model.offset[1]
                     off_z = model.offset[2]
                     if fore_is_y:
-                        this_obj.location = (off_x, off_z, off_y)
+                        this_obj.location = pof.swap_yz((off_x, off_y, off_z))
                     else:
                         this_obj.location = (off_x, off_y, off_z)
 
                     if tchunk.barrel_sobj[i] > -1:
                         bar_model = pof_handler.submodels[tchunk.barrel_sobj[i]]
-                        barrel_obj = create_mesh(bar_model, use_smooth_groups, fore_is_y, bmats)
+                        barrel_obj = create_mesh(bar_model, use_smooth_groups, fore_is_y, bmats, mesh_cache, meshes.get(bar_model.model_id))
                         barrel_obj.parent = this_obj
                         off_x += model.offset[0]
                         off_y += model.offset[1]
                         off_z += model.offset[2]
                         if fore_is_y:
-                            barrel_obj.location = (off_x, off_z, off_y)
+                            barrel_obj.location = pof.swap_yz((off_x, off_y, off_z))
                         else:
                             barrel_obj.location = (off_x, off_y, off_z)
                         new_objects[bar_model.model_id] = barrel_obj
                         scene.objects.link(barrel_obj)
                     new_objects[model.model_id] = this_obj
                     scene.objects.link(this_obj)
+                    yield len(new_objects) / num_steps
 
         if import_specials:
             for model in pof_handler.submodels.values():
                 if b"subsystem" in model.properties:
-                    this_obj = create_mesh(model, use_smooth_groups, fore_is_y, bmats)
+                    this_obj = create_mesh(model, use_smooth_groups, fore_is_y, bmats, mesh_cache, meshes.get(model.model_id))
                     this_obj.parent = new_objects[model.parent_id]
                     new_objects[model.model_id] = this_obj
                     scene.objects.link(this_obj)
+                    yield len(new_objects) / num_steps
 
     if import_shields and "SHLD" in pof_handler.chunks:
         model = pof_handler.chunks["SHLD"]
-        this_obj = create_mesh(model, False, fore_is_y, False)
+        this_obj = create_mesh(model, False, fore_is_y, False, m=meshes.get('shield'))
         this_obj.draw_type = "WIRE"
         new_objects["shield"] = this_obj
         scene.objects.link(this_obj)
+        yield len(new_objects) / num_steps
 
     #for obj in new_objects.values():
         #scene.objects.link(obj)
         
-    # TODO import helpers
-    
-    # helper = bpy.ops.object.empty_add(type='PLAIN_AXES', location=(0.0, 0.0, 0.0), rotation=(0.0, 0.0, 0.0))
+    # Helpers are made straight in bpy.data instead of with operators,
+    # which update the scene every time, then linked all at once
+    helpers = list()
 
     if import_eye_points and 'EYE' in pof_handler.chunks:
         eye_chunk = pof_handler.chunks['EYE']
+        if fore_is_y:
+            znorm = mathutils.Vector((0,0,1))
+        else:
+            znorm = mathutils.Vector((0,1,0))
         for i, e in enumerate(eye_chunk.eye_offset):
             if fore_is_y:
-                e = e[0], e[2], e[1]
-            bpy.ops.object.empty_add(type='SINGLE_ARROW', location=e)
-            eye = context.active_object
+                e = pof.swap_yz(e)
+            eye = new_empty('eye', 'SINGLE_ARROW', e)
             vec = mathutils.Vector(eye_chunk.eye_normal[i])
             if fore_is_y:
                 vec = vec.xzy
-                znorm = mathutils.Vector((0,0,1))
-            else:
-                znorm = mathutils.Vector((0,1,0))
-            quat = znorm.rotation_difference(vec)
-            eye.rotation_mode = 'QUATERNION'
-            eye.rotation_quaternion = quat
-            eye.rotation_mode = 'XYZ'
-            eye.name = 'eye'
-            print(new_objects)
-            if eye_chunk.sobj_num[i] in new_objects.keys():
+            eye.rotation_euler = znorm.rotation_difference(vec).to_euler()
+            if eye_chunk.sobj_num[i] in new_objects:
                 eye.parent = new_objects[eye_chunk.sobj_num[i]]
+            helpers.append(eye)
 
     if import_special_points and 'SPCL' in pof_handler.chunks:
         special_chunk = pof_handler.chunks['SPCL']
         for i, p in enumerate(special_chunk.points):
             if fore_is_y:
-                p = p[0], p[2], p[1]
-            bpy.ops.object.empty_add(type='SPHERE', location=p)
-            point = context.active_object
-            point.empty_draw_size = special_chunk.point_radius[i]
-            point.name = special_chunk.point_names[i].decode('UTF-8')
+                p = pof.swap_yz(p)
+            point = new_empty(special_chunk.point_names[i].decode('UTF-8'), 'SPHERE', p,
+                              special_chunk.point_radius[i])
             point['Properties'] = special_chunk.point_properties[i].decode('UTF-8')
-
-    if import_paths and 'PATH' in pof_handler.chunks:
+            helpers.append(point)
+
+    # Thrusters, glow banks and paths can have thousands of points between
+    # them, so they may be imported as one object each instead of an
+    # empty per point.  The exporter only reads thrusters and glow banks
+    # back as point clouds, so they aren't imported any other way.
+
+    if import_thrusters and 'FUEL' in pof_handler.chunks and helpers_as_points:
+        fuel_chunk = pof_handler.chunks['FUEL']
+        for i, points in enumerate(fuel_chunk.glow_pos):
+            if fuel_chunk.thruster_properties is not None:
+                props = fuel_chunk.thruster_properties[i].decode('UTF-8')
+            else:
+                props = ''
+            thruster = create_point_mesh('thruster-{}'.format(i), points,
+                                         fuel_chunk.glow_norm[i],
+                                         fuel_chunk.glow_radius[i], fore_is_y)
+            thruster['POF helper'] = 'thruster'
+            thruster['Properties'] = props
+            helpers.append(thruster)
+
+    if import_glow_points and 'GLOW' in pof_handler.chunks and helpers_as_points:
+        glow_chunk = pof_handler.chunks['GLOW']
+        for i, points in enumerate(glow_chunk.glow_points):
+            parent = new_objects.get(glow_chunk.parent_id[i])
+            bank = create_point_mesh('glow-{}'.format(i), points,
+                                     glow_chunk.glow_norms[i],
+                                     glow_chunk.glow_radius[i], fore_is_y)
+            bank['POF helper'] = 'glow'
+            bank['Properties'] = glow_chunk.properties[i].decode('UTF-8')
+            bank['Displacement time'] = glow_chunk.disp_time[i]
+            bank['On time'] = glow_chunk.on_time[i]
+            bank['Off time'] = glow_chunk.off_time[i]
+            if parent is not None:
+                bank.parent = parent
+            helpers.append(bank)
+
+    if import_paths and 'PATH' in pof_handler.chunks and helpers_as_points:
+        path_chunk = pof_handler.chunks['PATH']
+        for i, p in enumerate(path_chunk.path_names):
+            if not path_chunk.vert_list[i]:
+                continue
+            path = create_path_curve(p.decode('UTF-8'), path_chunk.vert_list[i],
+                                     path_chunk.vert_rad[i], fore_is_y)
+            path['POF helper'] = 'path'
+            path['Parent'] = path_chunk.path_parents[i].decode('UTF-8')
+            # turrets per point, flattened since properties can't nest lists
+            turrets = path_chunk.turret_sobj_num[i]
+            path['Turret counts'] = [len(t) for t in turrets]
+            flat_turrets = [n for t in turrets for n in t]
+            if flat_turrets:
+                path['Turrets'] = flat_turrets
+            helpers.append(path)
+
+    elif import_paths and 'PATH' in pof_handler.chunks:
         path_chunk = pof_handler.chunks['PATH']
         for i, p in enumerate(path_chunk.path_names):
+            par = path_chunk.path_parents[i].decode('UTF-8')
             for j, v in enumerate(path_chunk.vert_list[i]):
                 if fore_is_y:
-                    v = v[0], v[2], v[1]
-                bpy.ops.object.empty_add(type='SPHERE', location=v)
-                this_vert = context.active_object
-                this_vert.name = '{}-{}'.format(p.decode('UTF-8'), j)
-                this_vert.empty_draw_size = path_chunk.vert_rad[i][j]
-                par = path_chunk.path_parents[i].decode('UTF-8')
+                    v = pof.swap_yz(v)
+                this_vert = new_empty('{}-{}'.format(p.decode('UTF-8'), j), 'SPHERE', v,
+                                      path_chunk.vert_rad[i][j])
                 if not j:
                     par_vert = this_vert
                 if not j and par in scene.objects:
@@ -523,7 +778,8 @@ def load(operator, context, filepath,
                     this_vert.parent = par_vert
                 this_vert['Parent'] = par
                 this_vert['Turret'] = path_chunk.turret_sobj_num[i][j]
-            
+                helpers.append(this_vert)
+
     # Import custom properties
     
     if import_header_data:
@@ -533,9 +789,8 @@ def load(operator, context, filepath,
         # center of mass should be helper empty
         p = pof_handler.header.mass_center
         if fore_is_y:
-            p = p[0], p[2], p[1]
-        bpy.ops.object.empty_add(type='PLAIN_AXES', location=p)
-        bpy.context.active_object.name = 'center-mass'
+            p = pof.swap_yz(p)
+        helpers.append(new_empty('center-mass', 'PLAIN_AXES', p))
         # have to break up inertia tensor b/c blender props only accept lists of ints/floats
         scene['Inertia-0'] = list(pof_handler.header.inertia_tensor[0])
         scene['Inertia-1'] = list(pof_handler.header.inertia_tensor[1])
@@ -545,10 +800,12 @@ def load(operator, context, filepath,
         scene['Cross section radii'] = pof_handler.header.cross_section_radius
         scene['Misc. info'] = ' '.join(pof_handler.chunks['PINF'].lines)
 
+    for obj in helpers:
+        scene.objects.link(obj)
+
     # done
 
     scene.update()
     new_time = time.time()
     print("\ttime to add objects {}".format(new_time - cur_time))
-
-    return {'FINISHED'}
\ No newline at end of file
+    yield 1.0
\ No newline at end of file
@@ -0,0 +1,617 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""Import and export operators, registered by the package when it's loaded in Blender."""
+
+import os
+import queue
+import subprocess
+import threading
+import time
+import traceback
+import bpy
+from bpy.props import (BoolProperty,
+                       FloatProperty,
+                       IntProperty,
+                       StringProperty,
+                       EnumProperty,
+                       )
+from bpy_extras.io_utils import (ExportHelper,
+                                 ImportHelper,
+                                 path_reference_mode,
+                                 )
+
+class ImportPOF(bpy.types.Operator, ImportHelper):
+    """Load a FS2_Open POF File"""
+    bl_idname = "import_scene.pof"
+    bl_label = "Import POF"
+    bl_options = {'PRESET', 'UNDO'}
+
+    filename_ext = ".pof"
+    filter_glob = StringProperty(
+            default="*.pof",
+            options={'HIDDEN'},
+            )
+    use_smooth_groups = BoolProperty(
+            name="Import smooth groups",
+            description="Try to make smoothgroups using EdgeSplit modifier.",
+            default=False,
+            )   # Probably not very good at it
+    # Helpers:
+    import_eye_points = BoolProperty(
+            name="Import viewpoints",
+            description="Import eye points as empties.",
+            default=True,
+            )   # Imported as vector empties
+    import_paths = BoolProperty(
+            name="Import paths",
+            description="Import path points as empties.",
+            default=True,
+            )   # Imported as sphere empties parented to first point in path
+    import_docks = BoolProperty(
+            name="Import docks",
+            description="Import docking points as empties.",
+            default=True,
+            )
+    import_gun_points = BoolProperty(
+            name="Import guns",
+            description="Import gun points as empties.",
+            default=True,
+            )   # Imported as vector empties
+    import_mis_points = BoolProperty(
+            name="Import missiles",
+            description="Import missile points as empties.",
+            default=True,
+            )   # Imported as vector empties
+    import_tgun_points = BoolProperty(
+            name="Import gun turrets",
+            description="Import turret gun points as empties.",
+            default=True,
+            )   # Imported as vector empties
+    import_tmis_points = BoolProperty(
+            name="Import missile turrets",
+            description="Import turret missile points as empties.",
+            default=True,
+            )   # Imported as vector empties
+    import_thrusters = BoolProperty(
+            name="Import thrusters",
+            description="Import thrusters as empties.",
+            default=True,
+            )   # Imported as sphere empties
+    import_glow_points = BoolProperty(
+            name="Import glows",
+            description="Import glow points as empties.",
+            default=True,
+            )   # Imported as sphere empties
+    import_flash_points = BoolProperty(
+            name="Import muzzleflashes",
+            description="Import muzzleflash lights as empties.",
+            default=True,
+            )   # Imported as regular empties
+    import_special_points = BoolProperty(
+            name="Import special points",
+            description="Import special points as empties.",
+            default=True,
+            )   # Imported as sphere empties
+    import_acen = BoolProperty(
+            name="Import autocenter point",
+            description="Import autocenter point (for tech room) as empty.",
+            default=False,
+            )
+    import_header_data = BoolProperty(
+            name="Import header",
+            description="Import extra header data as scene custom properties.",
+            default=True,
+            )
+    # Models:
+    import_only_main = BoolProperty(
+            name="Import only hull",
+            description="Import only main LOD and its children.",
+            default=False,
+            )
+    import_detail_levels = BoolProperty(
+            name="Import all LODs",
+            description="Import LOD models.",
+            default=True,
+            )   # Will import each LOD on a separate layer
+    import_detail_boxes = BoolProperty(
+            name="Import detail boxes",
+            description="Import detail box models.",
+            default=True,
+            )
+    import_debris = BoolProperty(
+            name="Import debris",
+            description="Import debris models.",
+            default=True,
+            )   # Will import on a separate layer from LODs.
+    import_turrets = BoolProperty(
+            name="Import turrets",
+            description="Import turret models.",
+            default=True,
+            )   # If LODs selected, will import these parented appropriately
+    import_specials = BoolProperty(
+            name="Import subsystems",
+            description="Import special objects (subsystems).",
+            default=True,
+            )
+    import_insignia = BoolProperty(
+            name="Import insignia",
+            description="Import squad insignia.",
+            default=True,
+            )
+    fore_is_y = BoolProperty(
+            name="Switch axes",
+            description="If true, fore is Blender's +Y-axis.",
+            default=True,
+            )   # Otherwise, fore is Z-axis
+    import_shields = BoolProperty(
+            name="Import shield",
+            description="Import wireframe shield mesh.",
+            default=True,
+            )   # Imports on same layer as highest detail level
+    # Textures:
+    import_textures = BoolProperty(
+            name="Import textures",
+            description="Import textures and UV data.",
+            default=False,
+            )
+    texture_path = StringProperty(
+            name="Texture path",
+            description="Path to search for textures in.",
+            default="/../maps/",
+            #subtype="FILE_PATH",
+            )
+    texture_format = EnumProperty(
+            name="Texture format",
+            items=(('.dds', "*.dds", "DirectDraw Surface"),
+                   ('.png', "*.png", "Portable Network Graphics"),
+                   ('.tga', "*.tga", "Targa"),
+                   ('.jpg', "*.jpg", "Joint Photographic Experts Group")),
+            default='.dds')
+    pretty_materials = BoolProperty(
+            name="Make materials",
+            description="Make Blender materials from normal, shine, glow maps if possible.",
+            default=False,
+            )
+    helpers_as_points = BoolProperty(
+            name="Helpers as point clouds",
+            description="Import each thruster and glow bank as one vertex-only mesh and "
+              "each path as one curve, instead of an empty per path point.  Thrusters and "
+              "glow banks are only imported this way.",
+            default=False,
+            )
+    use_background = BoolProperty(
+            name="Load in background",
+            description="Read the file in another thread and add objects a few at a time, "
+              "so Blender stays usable.  Press Esc to stop.",
+            default=False,
+            )
+
+    # seconds of object creation per timer tick when loading in background
+    slice_time = 0.05
+
+    def execute(self, context):
+        from . import import_pof
+
+        keywords = self.as_keywords(ignore=("filter_glob", "use_background"))
+        if not self.use_background:
+            return import_pof.load(self, context, **keywords)
+
+        # the worker only fills in this dict, it never touches bpy; the lock
+        # decides whether it or _finish() has the archive to close
+        self._result = dict()
+        self._lock = threading.Lock()
+        self._keywords = keywords
+        self._steps = None
+        self._thread = threading.Thread(target=self._read,
+                                        args=(self._result, self._lock, self.filepath,
+                                              self.fore_is_y, self.import_textures))
+        self._thread.daemon = True
+        self._thread.start()
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.1, context.window)
+        wm.progress_begin(0.0, 1.0)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    @staticmethod
+    def _read(result, lock, filepath, fore_is_y, flip_v):
+        from . import import_pof
+
+        try:
+            pof_handler, archive = import_pof.read_model(filepath)
+            meshes = import_pof.prepare_meshes(pof_handler, fore_is_y, flip_v)
+        except Exception as e:
+            result['error'] = e
+            return
+        with lock:
+            if not result.get('cancelled'):
+                result['model'] = (pof_handler, archive, meshes)
+                return
+        if archive is not None:
+            archive.close()
+
+    def modal(self, context, event):
+        from . import import_pof
+
+        if event.type == 'ESC':
+            return self._finish(context, cancelled=True)
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        if self._steps is None:
+            if self._thread.is_alive():
+                return {'PASS_THROUGH'}
+            if 'error' in self._result:
+                self.report({'ERROR'}, "Couldn't read {}: {}".format(self.filepath,
+                                                                    self._result['error']))
+                return self._finish(context, cancelled=True)
+            pof_handler, archive, meshes = self._result['model']
+            self._steps = import_pof.load_steps(self, context, pof_handler=pof_handler,
+                                                archive=archive, meshes=meshes,
+                                                **self._keywords)
+
+        # make objects until this slice is used up, then give the UI a turn
+        deadline = time.time() + self.slice_time
+        wm = context.window_manager
+        try:
+            for progress in self._steps:
+                wm.progress_update(progress)
+                if time.time() > deadline:
+                    return {'PASS_THROUGH'}
+        except Exception as e:
+            traceback.print_exc()
+            self.report({'ERROR'}, "Couldn't import {}: {}".format(self.filepath, e))
+            return self._finish(context, cancelled=True)
+        return self._finish(context)
+
+    def _finish(self, context, cancelled=False):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        if not cancelled:
+            return {'FINISHED'}
+        with self._lock:
+            self._result['cancelled'] = True
+            model = self._result.get('model')
+        if model is not None and model[1] is not None:
+            model[1].close()
+        if self._steps is not None:
+            # whatever was linked so far stays in the scene
+            self._steps.close()
+            self.report({'WARNING'}, "POF import stopped, some objects were already added")
+        return {'CANCELLED'}
+
+    def draw(self, context):
+        layout = self.layout
+
+        layout.prop(self, "use_background")
+        layout.prop(self, "use_smooth_groups")
+        layout.prop(self, "import_header_data")
+        layout.prop(self, "fore_is_y")
+
+        box = layout.box()
+        box.label(text="Helpers")
+        box.prop(self, "import_acen")
+        box.prop(self, "import_eye_points")
+        box.prop(self, "import_paths")
+        box.prop(self, "import_docks")
+        box.prop(self, "import_gun_points")
+        box.prop(self, "import_mis_points")
+        box.prop(self, "import_tgun_points")
+        box.prop(self, "import_tmis_points")
+        box.prop(self, "import_flash_points")
+        box.prop(self, "import_thrusters")
+        box.prop(self, "import_glow_points")
+        box.prop(self, "import_special_points")
+        box.prop(self, "helpers_as_points")
+
+        box = layout.box()
+        box.label(text="Models")
+        box.prop(self, "import_only_main")
+        if not self.import_only_main:
+            box.prop(self, "import_detail_levels")
+            box.prop(self, "import_detail_boxes")
+            box.prop(self, "import_debris")
+            box.prop(self, "import_turrets")
+            box.prop(self, "import_specials")
+            box.prop(self, "import_insignia")
+        box.prop(self, "import_shields")
+
+        box = layout.box()
+        box.label(text="Textures")
+        box.prop(self, "import_textures")
+        if self.import_textures:
+            box.prop(self, "texture_path")
+        box.prop(self, "pretty_materials")
+
+
+class ExportPOF(bpy.types.Operator, ExportHelper):
+    """Export a FS2_Open POF File"""
+    bl_idname = "export_scene.pof"
+    bl_label = "Export POF"
+    bl_options = {'PRESET', 'UNDO'}
+
+    filename_ext = ".pof"
+    filter_glob = StringProperty(
+            default="*.pof",
+            options={'HIDDEN'},
+            )
+    fore_is_y = BoolProperty(
+            name="Switch axes",
+            description="If true, fore is Blender's +Y-axis.",
+            default=True,
+            )
+    export_subobjects = BoolProperty(
+            name="Export subobjects",
+            description="Export subobject data.  Does not necessarily include geometry!",
+            default=True,
+            )
+    export_geometry = BoolProperty(
+            name="Export geometry",
+            description="Export geometry (including shields and insignia), making BSP and "
+              "shield collision trees.",
+            default=True,
+            )
+    export_textures = BoolProperty(
+            name="Export textures",
+            description="Export TXTR chunk based on materials in this scene.",
+            default=True,
+            )
+    export_eye_points = BoolProperty(
+            name="Export viewpoints",
+            description="Eye points must be empties named starting with 'eye' parented to a valid"
+              " submodel.",
+            default=True,
+            )
+    export_paths = BoolProperty(
+            name="Export paths",
+            description="Paths must be a collection of empties named starting with 'path', with the"
+              " first node parented to a valid submodel and other nodes parented to the first node"
+              "  Size of the empty will also be exported.",
+            default=True,
+            )
+    export_dock_points = BoolProperty(
+            name="Export dock points",
+            description="Docking points must empties named starting with 'dock'.  All docking points"
+              " that are parented to a given object will be considered one dock, and the parent will"
+              " not be exported, though the parent should include custom properties 'Properties' "
+              "and 'Path', which will be exported.  Each point's normal will also be exported.",
+              default=True,
+              )
+    export_gun_points = BoolProperty(
+            name="Export gun points",
+            description="Gun points should be empties named starting with 'gun'.  All gun points "
+              "that are parented to a given object will be considered one gun bank, and the parent "
+              "will not be exported.  Normal of the empty will be exported.",
+            default=True,
+            )
+    export_mis_points = BoolProperty(
+            name="Export missile points",
+            description="Missile points should be empties named starting with 'mis'.  All missile points "
+              "that are parented to a given object will be considered one missile bank, and the "
+              "parent will not be exported.  Normal of the empty will be exported.",
+            default=True,
+            )
+    export_tgun_points = BoolProperty(
+            name="Export turret gun points",
+            description="Turret guns should be empties named starting with 'tgun'.  They should be "
+              "parented to their turret (or turret arm if multi-part turret).  Normal of the empty "
+              "will also be exported.",
+            default=True,
+            )
+    export_tmis_points = BoolProperty(
+            name="Export turret missile points",
+            description="Turret guns should be empties named starting with 'tmis'.  They should be "
+              "parented to their turret (or turret arm if multi-part turret).  Normal of the empty "
+              "will also be exported.",
+            default=True,
+            )
+    export_flash_points = BoolProperty(
+            name="Export muzzleflash poins",
+            description="Muzzleflash points should be empties named starting with 'muz'.  Only "
+              "location and a custom property 'Type' will be exported.",
+            default=True,
+            )
+    export_thruster_points = BoolProperty(
+            name="Export thruster points",
+            description="Thrusters should be empties named starting with 'thrust'.  All thruster "
+              "points that are parented to a given object will be considered one thruster (a set "
+              "of thruster glows), and the parent will not be exported.  Radius and normal of "
+              "the empty will be exported.",
+            default=True,
+            )
+    export_glow_points = BoolProperty(
+            name="Export glow points",
+            description="Glow points should be empties named starting with 'glow'.  All glows "
+              "that are parented to a given object will be considered one glowbank, and the parent"
+              " will not be exported.  Radius, normal, and additional properties will be exported.",
+            default=True,
+            )
+    export_special_points = BoolProperty(
+            name="Export special points",
+            description="All empties not otherwise covered by other options will be exported as "
+              "special points, which can be used as subsystems, depending on how they're named.  "
+              "Size and custom property 'Properties' will also be exported.",
+            default=True,
+            )
+    export_acen = BoolProperty(
+            name="Export autocenter point",
+            description="Autocenter point for tech room should be an empty named starting with 'acen'.",
+            default=True,
+            )
+    export_header_data = BoolProperty(
+            name="Export header data",
+            description="Header data should be scene custom properties.",
+            default=True,
+            )
+    use_bsp_cache = BoolProperty(
+            name="Cache BSP trees",
+            description="Reuse BSP trees from earlier exports for submodels whose geometry "
+              "hasn't changed.",
+            default=True,
+            )
+    weld_distance = FloatProperty(
+            name="Weld distance",
+            description="Merge verts closer together than this (0 merges only identical verts).",
+            min=0.0, max=1.0,
+            default=0.0,
+            precision=5,
+            )
+    weld_normal_distance = FloatProperty(
+            name="Weld normal distance",
+            description="Merge normals of a vert that differ by less than this "
+              "(0 merges only identical normals).",
+            min=0.0, max=1.0,
+            default=0.0,
+            precision=5,
+            )
+    jobs = IntProperty(
+            name="BSP build processes",
+            description="Split the BSP trees of large submodels between this many processes.",
+            min=1, max=64,
+            default=1,
+            )
+    use_background = BoolProperty(
+            name="Export in background",
+            description="Build BSP trees and write the file in a separate process, "
+              "so Blender stays usable.  Press Esc to stop.",
+            default=False,
+            )
+
+
+    def execute(self, context):
+        from . import export_pof, export_worker
+
+        keywords = self.as_keywords(ignore=("filter_glob","check_existing","use_background"))
+        if not self.use_background:
+            return export_pof.export(self, context, **keywords)
+
+        # the scene is read here; only the bpy-free part goes to the worker
+        job_path = export_worker.write_job(export_pof.make_export_job(self, context, **keywords))
+        self._job_path = job_path
+        package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self._proc = subprocess.Popen([bpy.app.binary_path_python, "-m",
+                                       __package__ + ".export_worker", job_path],
+                                      cwd=package_dir,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT,
+                                      universal_newlines=True)
+        # a pipe can't be polled without blocking on Windows, so a thread
+        # forwards its lines
+        self._lines = queue.Queue()
+        self._reader = threading.Thread(target=self._read_lines,
+                                        args=(self._proc.stdout, self._lines))
+        self._reader.daemon = True
+        self._reader.start()
+        self._error = None
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.1, context.window)
+        wm.progress_begin(0.0, 1.0)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    @staticmethod
+    def _read_lines(pipe, lines):
+        for line in pipe:
+            lines.put(line.rstrip('\n'))
+        pipe.close()
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self._proc.terminate()
+            self.report({'WARNING'}, "POF export stopped, {} wasn't written".format(self.filepath))
+            return self._finish(context, {'CANCELLED'})
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        wm = context.window_manager
+        while True:
+            try:
+                line = self._lines.get_nowait()
+            except queue.Empty:
+                break
+            if line.startswith("progress "):
+                fraction, message = line[9:].split(" ", 1)
+                wm.progress_update(float(fraction))
+                print("\t" + message)
+            elif line.startswith("error "):
+                self._error = line[6:]
+            elif line != "done":
+                print(line)
+
+        if self._proc.poll() is None or self._reader.is_alive():
+            return {'PASS_THROUGH'}
+        if self._proc.returncode or self._error is not None:
+            self.report({'ERROR'}, "POF export failed: {}".format(self._error))
+            return self._finish(context, {'CANCELLED'})
+        self.report({'INFO'}, "Exported {}".format(self.filepath))
+        return self._finish(context, {'FINISHED'})
+
+    def _finish(self, context, result):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        # the worker deletes the job itself unless it was killed
+        if os.path.isfile(self._job_path):
+            os.remove(self._job_path)
+        return result
+
+    def draw(self, context):
+        layout = self.layout
+
+        layout.prop(self, "use_background")
+        layout.prop(self, "export_header_data")
+        layout.prop(self, "export_acen")
+        layout.prop(self, "fore_is_y")
+
+        box = layout.box()
+        box.label(text="Meshes")
+        box.prop(self, "export_subobjects")
+        if self.export_subobjects:
+            box.prop(self, "export_geometry")
+            if self.export_geometry:
+                box.prop(self, "use_bsp_cache")
+                box.prop(self, "jobs")
+                box.prop(self, "weld_distance")
+                box.prop(self, "weld_normal_distance")
+        box.prop(self, "export_textures")
+
+        box = layout.box()
+        box.label(text="Points")
+        box.prop(self, "export_eye_points")
+        box.prop(self, "export_thruster_points")
+        box.prop(self, "export_glow_points")
+        box.prop(self, "export_special_points")
+
+        box = layout.box()
+        box.label(text="Paths")
+        box.prop(self, "export_paths")
+        box.prop(self, "export_dock_points")
+
+        box = layout.box()
+        box.label(text="Guns")
+        box.prop(self, "export_gun_points")
+        box.prop(self, "export_mis_points")
+        box.prop(self, "export_tgun_points")
+        box.prop(self, "export_tmis_points")
+        box.prop(self, "export_flash_points")
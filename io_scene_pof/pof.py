@@ -21,9 +21,17 @@
 
 
 
-from math import fsum, sqrt
+from array import array
+from math import floor, fsum, sqrt
 from .bintools import *
+import hashlib
 import logging
+import multiprocessing
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 ## Exceptions ##
@@ -167,6 +175,358 @@ def vavg(vecs):
     return ax, ay, az
 
 
+_NEIGHBOR_CELLS = [(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)]
+
+
+def weld_points(points, epsilon):
+    """
+    Given a list of vectors, merge each one into the nearest earlier kept
+    vector no farther than epsilon, using a uniform grid of epsilon-sized
+    cells so only neighboring cells are searched
+
+    Returns a list of the kept vectors and a list of the index in it for
+    each input vector.  With epsilon 0, only identical vectors merge
+    """
+    kept = list()
+    remap = list()
+    if epsilon <= 0:
+        index = dict()
+        for p in points:
+            p = tuple(p)
+            i = index.get(p)
+            if i is None:
+                i = len(kept)
+                index[p] = i
+                kept.append(p)
+            remap.append(i)
+        return kept, remap
+
+    eps2 = epsilon * epsilon
+    inv = 1.0 / epsilon
+    grid = dict()
+    for p in points:
+        p = tuple(p)
+        cx = int(floor(p[0] * inv))
+        cy = int(floor(p[1] * inv))
+        cz = int(floor(p[2] * inv))
+        best = None
+        best_d2 = eps2
+        for dx, dy, dz in _NEIGHBOR_CELLS:
+            cell = grid.get((cx + dx, cy + dy, cz + dz))
+            if cell is None:
+                continue
+            for i in cell:
+                q = kept[i]
+                d2 = (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 + (p[2] - q[2]) ** 2
+                if d2 <= eps2 and (best is None or d2 < best_d2):
+                    best = i
+                    best_d2 = d2
+        if best is None:
+            best = len(kept)
+            kept.append(p)
+            grid.setdefault((cx, cy, cz), list()).append(best)
+        remap.append(best)
+    return kept, remap
+
+
+def swap_yz(v):
+    """
+    Given a vector, return it with Y and Z switched, to convert between
+    Blender's Z-up and the POF's Y-up axes
+    """
+    return v[0], v[2], v[1]
+
+
+# Columns are swapped this many vectors at a time, so flipping a large
+# array never needs a temporary copy of more than one block
+_FLIP_BLOCK = 65536
+
+
+def swap_columns(data, width, a, b):
+    """
+    Swaps columns a and b of a flat array (or list) of width-vectors in place
+    """
+    block = _FLIP_BLOCK * width
+    for start in range(0, len(data), block):
+        end = min(start + block, len(data))
+        col = data[start + a:end:width]
+        data[start + a:end:width] = data[start + b:end:width]
+        data[start + b:end:width] = col
+
+
+def negate_column(data, width, a):
+    """
+    Negates column a of a flat array of width-vectors in place
+    """
+    block = _FLIP_BLOCK * width
+    for start in range(0, len(data), block):
+        end = min(start + block, len(data))
+        col = data[start + a:end:width]
+        for i in range(len(col)):
+            col[i] = -col[i]
+        data[start + a:end:width] = col
+
+
+# A face whose area is below this fraction of its longest edge squared
+# is considered degenerate
+DEGENERATE_EPSILON = 1e-10
+
+
+def face_metrics(verts, faces, as_arrays=False):
+    """
+    Given a vertex list and a list of faces (lists of vertex indices),
+    return lists of face centers, unit normals, areas, and radii, and a
+    list of bools marking degenerate faces
+
+    Radius is the circumradius of the face's first three verts, as the
+    engine expects.  Degenerate faces get a zero normal and the distance
+    to their farthest vert as radius instead of raising
+
+    If as_arrays, centers and normals come back as flat float arrays,
+    areas and radii as float arrays and degenerate as a byte array
+    """
+    if not faces:
+        metrics = list(), list(), list(), list(), list()
+    elif numpy is not None:
+        metrics = _face_metrics_numpy(verts, faces, as_arrays)
+        if as_arrays:
+            return metrics
+    else:
+        metrics = _face_metrics_python(verts, faces)
+    if as_arrays:
+        centers, normals, areas, radii, degenerate = metrics
+        return (array('f', [c for v in centers for c in v]),
+                array('f', [c for v in normals for c in v]),
+                array('f', areas), array('f', radii), array('B', degenerate))
+    return metrics
+
+
+def _face_metrics_python(verts, faces):
+
+    centers = list()
+    normals = list()
+    areas = list()
+    radii = list()
+    degenerate = list()
+    for f in faces:
+        pts = [verts[i] for i in f]
+        n = len(pts)
+        cx = fsum(p[0] for p in pts) / n
+        cy = fsum(p[1] for p in pts) / n
+        cz = fsum(p[2] for p in pts) / n
+        # Newell's method, twice the area vector for any planar polygon
+        nx = ny = nz = 0.0
+        longest = 0.0
+        for k in range(n):
+            p = pts[k]
+            q = pts[(k + 1) % n]
+            nx += (p[1] - q[1]) * (p[2] + q[2])
+            ny += (p[2] - q[2]) * (p[0] + q[0])
+            nz += (p[0] - q[0]) * (p[1] + q[1])
+            d2 = (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 + (p[2] - q[2]) ** 2
+            if d2 > longest:
+                longest = d2
+        mag = sqrt(nx * nx + ny * ny + nz * nz)
+        a, b, c = pts[0], pts[1], pts[2]
+        la = vdist(a, b)
+        lb = vdist(b, c)
+        lc = vdist(c, a)
+        ux, uy, uz = b[0] - a[0], b[1] - a[1], b[2] - a[2]
+        vx, vy, vz = c[0] - a[0], c[1] - a[1], c[2] - a[2]
+        tri2 = sqrt((uy * vz - uz * vy) ** 2 + (uz * vx - ux * vz) ** 2 + (ux * vy - uy * vx) ** 2)
+        limit = DEGENERATE_EPSILON * longest
+        if mag <= limit or tri2 <= limit:
+            degenerate.append(True)
+            normals.append((0.0, 0.0, 0.0))
+            radii.append(max(vdist((cx, cy, cz), p) for p in pts))
+        else:
+            degenerate.append(False)
+            normals.append((nx / mag, ny / mag, nz / mag))
+            # r = abc / 4K, where 2K = tri2
+            radii.append(la * lb * lc / (2 * tri2))
+        centers.append((cx, cy, cz))
+        areas.append(mag / 2)
+    return centers, normals, areas, radii, degenerate
+
+
+def _face_metrics_numpy(verts, faces, as_arrays=False):
+    np = numpy
+    num_faces = len(faces)
+    if isinstance(verts, VectorView):
+        v = np.frombuffer(verts.data, dtype=verts.data.typecode).astype(np.float64).reshape(-1, 3)
+    else:
+        v = np.asarray(verts, dtype=np.float64).reshape(-1, 3)
+    if isinstance(faces, RaggedView):
+        bounds = np.frombuffer(faces.starts, dtype=np.int32).astype(np.int64)
+        lens = np.diff(bounds)
+        corners = np.frombuffer(faces.data, dtype=np.int32).astype(np.int64)
+    else:
+        lens = np.fromiter((len(f) for f in faces), np.int64, num_faces)
+        corners = np.fromiter((i for f in faces for i in f), np.int64, int(lens.sum()))
+    starts = np.cumsum(lens) - lens
+    corner_face = np.repeat(np.arange(num_faces), lens)
+    pts = v[corners]
+
+    centers = np.add.reduceat(pts, starts) / lens[:, None]
+
+    # next corner around each face, for edges and the Newell sum
+    nxt = np.arange(len(corners)) + 1
+    last = starts + lens - 1
+    nxt[last] = starts
+    p = pts
+    q = pts[nxt]
+    newell = np.empty_like(p)
+    newell[:, 0] = (p[:, 1] - q[:, 1]) * (p[:, 2] + q[:, 2])
+    newell[:, 1] = (p[:, 2] - q[:, 2]) * (p[:, 0] + q[:, 0])
+    newell[:, 2] = (p[:, 0] - q[:, 0]) * (p[:, 1] + q[:, 1])
+    area_vec = np.add.reduceat(newell, starts)
+    mag = np.sqrt((area_vec ** 2).sum(axis=1))
+    longest = np.maximum.reduceat(((p - q) ** 2).sum(axis=1), starts)
+
+    a = v[corners[starts]]
+    b = v[corners[starts + 1]]
+    c = v[corners[starts + 2]]
+    la = np.sqrt(((a - b) ** 2).sum(axis=1))
+    lb = np.sqrt(((b - c) ** 2).sum(axis=1))
+    lc = np.sqrt(((c - a) ** 2).sum(axis=1))
+    tri2 = np.sqrt((np.cross(b - a, c - a) ** 2).sum(axis=1))
+
+    limit = DEGENERATE_EPSILON * longest
+    degenerate = (mag <= limit) | (tri2 <= limit)
+    ok = ~degenerate
+    normals = np.zeros_like(area_vec)
+    normals[ok] = area_vec[ok] / mag[ok][:, None]
+    radii = np.empty(num_faces)
+    radii[ok] = la[ok] * lb[ok] * lc[ok] / (2 * tri2[ok])
+    if degenerate.any():
+        dist = np.sqrt(((pts - centers[corner_face]) ** 2).sum(axis=1))
+        radii[degenerate] = np.maximum.reduceat(dist, starts)[degenerate]
+
+    if as_arrays:
+        def to_array(typecode, values):
+            a = array(typecode)
+            a.frombytes(values.astype(typecode).tobytes())
+            return a
+        return (to_array('f', centers.ravel()),
+                to_array('f', normals.ravel()),
+                to_array('f', mag / 2),
+                to_array('f', radii),
+                to_array('B', degenerate))
+    return ([tuple(x) for x in centers.tolist()],
+            [tuple(x) for x in normals.tolist()],
+            (mag / 2).tolist(),
+            radii.tolist(),
+            degenerate.tolist())
+
+
+class VectorView:
+    """
+    A read-only sequence of width-tuples over a flat array, so array-backed
+    data can go anywhere a list of vectors is expected
+
+    data - the flat array
+    width - number of components per item
+    """
+    def __init__(self, data, width=3):
+        self.data = data
+        self.width = width
+
+    def __len__(self):
+        return len(self.data) // self.width
+
+    def __getitem__(self, i):
+        w = self.width
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("VectorView index out of range")
+        return tuple(self.data[i * w:i * w + w])
+
+    def __iter__(self):
+        data = self.data
+        w = self.width
+        for i in range(0, len(data) - w + 1, w):
+            yield tuple(data[i:i + w])
+
+    def __repr__(self):
+        return "<VectorView of {} {}-vectors>".format(len(self), self.width)
+
+
+class RaggedView:
+    """
+    A read-only sequence of variable-length lists over a flat array and an
+    array of start offsets (compressed rows), e.g. faces of different
+    vert counts
+
+    data - the flat array, width values per entry
+    starts - array of len(self) + 1 offsets into data, in entries
+    width - values per entry; 1 gives lists of values, more gives lists
+        of tuples
+    """
+    def __init__(self, data, starts, width=1):
+        self.data = data
+        self.starts = starts
+        self.width = width
+
+    @classmethod
+    def from_lists(cls, lists, typecode='i', width=1):
+        """
+        Makes a RaggedView from a list of lists (of tuples if width > 1)
+        """
+        data = array(typecode)
+        starts = array('i', [0])
+        for l in lists:
+            if width == 1:
+                data.extend(l)
+            else:
+                for item in l:
+                    data.extend(item)
+            starts.append(len(data) // width)
+        return cls(data, starts, width)
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("RaggedView index out of range")
+        w = self.width
+        row = self.data[self.starts[i] * w:self.starts[i + 1] * w]
+        if w == 1:
+            return row.tolist()
+        return [tuple(row[k:k + w]) for k in range(0, len(row), w)]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return "<RaggedView of {} rows>".format(len(self))
+
+
+class OptionalIntView:
+    """
+    A read-only sequence over an int array, with -1 standing for None
+    """
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, i):
+        n = self.data[i]
+        if n < 0:
+            return None
+        return n
+
+    def __iter__(self):
+        for n in self.data:
+            yield None if n < 0 else n
+
+
 class Mesh:
     """
     A collection of lists
@@ -177,9 +537,11 @@ class Mesh:
     fnorms - a list of 3-tuples representing face normals (export only)
     vnorms - a list of 3-tuples of vectors representing vertex normals (assigned)
     num_norms - a list indicating the number of normals each vertex has (assigned, import only)
-    edges - a dict where each key is a frozenset of two vectors representing
-        vertex coords and where each value is bool, whether the edge is sharp (import only) (calc)
+    sharp - an array of bools, whether each edge of get_adjacency() is sharp,
+        in its edge order (import only) (calc)
     fradii - a list of face radii (export only) (calc)
+    areas - a list of face areas (export only) (calc)
+    degenerate - a list of bools, whether each face has no area (export only) (calc)
     centers - a list of face centers (export only) (assigned)
     tex_ids - a list of texture ids (assigned) == material id in Blender
 
@@ -187,6 +549,17 @@ class Mesh:
     each with its own normal.  During export, we should determine if a vertex is already
     in the vertex list, and if it is, use its index instead of adding a new one.
     """
+    def get_adjacency(self):
+        """
+        Returns a MeshAdjacency for the current face list, building it
+        the first time it's asked for
+        """
+        adj = getattr(self, '_adjacency', None)
+        if adj is None or adj.faces is not self.faces:
+            adj = MeshAdjacency(self.faces, len(self.verts))
+            self._adjacency = adj
+        return adj
+
     def calc_sharp(self):
         """
         Calculate edges from face and normal lists
@@ -194,54 +567,24 @@ class Mesh:
         Use during import
         """
         # Let's do this the easy way, sharp if edge includes vert with >1 norm
-        # for each face
-            # for each pair of verts in face
-                # make a frozenset of the verts coords
-                # for each vert in pair
-                    # if vert has >1 norm
-                        # edge is sharp
-                    # else
-                        # edge is not sharp
-        faces = self.faces
-        verts = self.verts
-        num_norms = self.num_norms
-        edges = dict()
-        for f in faces:
-            e1 = verts[f[0]], verts[f[1]]
-            e2 = verts[f[1]], verts[f[2]]
-            e3 = verts[f[2]], verts[f[0]]
-            e1 = frozenset(e1)
-            e2 = frozenset(e2)
-            e3 = frozenset(e3)
-            if num_norms[f[0]] == 1:
-                # if this edge is already accounted for,
-                # either it will already be False or True
-                # takes priority
-                if e1 not in edges.keys():
-                    edges[e1] = False
-                if e3 not in edges.keys():
-                    edges[e3] = False
-            else:
-                edges[e1] = True
-                edges[e2] = True
-            if num_norms[f[1]] == 1:
-                if e1 not in edges.keys():
-                    edges[e1] = False
-                if e2 not in edges.keys():
-                    edges[e2] = False
-            else:
-                edges[e1] = True
-                edges[e2] = True
-            if num_norms[f[2]] == 1:
-                if e2 not in edges.keys():
-                    edges[e2] = False
-                if e3 not in edges.keys():
-                    edges[e3] = False
-            else:
-                edges[e2] = True
-                edges[e3] = True
+        multi = [n > 1 for n in self.num_norms]
+        edge_verts = self.get_adjacency().edge_verts
+        sharp = array('B', [multi[edge_verts[i]] or multi[edge_verts[i + 1]]
+                            for i in range(0, len(edge_verts), 2)])
+
+        self.sharp = sharp
+        return sharp
+
+    def calc_face_metrics(self):
+        """
+        Calculate centers, fnorms, areas, fradii and degenerate
 
-        self.edges = edges
+        Use during export
+        """
+        metrics = face_metrics(self.verts, self.faces)
+        self.centers, self.fnorms, self.areas, self.fradii, self.degenerate = metrics
+        if any(self.degenerate):
+            logging.warning("Mesh has {} degenerate faces".format(sum(self.degenerate)))
 
     def calc_fradii(self):
         """
@@ -249,40 +592,19 @@ class Mesh:
         
         Use during export
         """
-        # where a, b, c are the length of each edge:
-        # r = abc / sqrt(2aabb + 2bbcc + 2ccaa - a**4 - b**4 - c**4)
-        faces = self.faces
-        verts = self.verts
-        fradii = list()
-        for f in faces:
-            a = vdist(verts[f[0]], verts[f[1]])
-            b = vdist(verts[f[1]], verts[f[2]])
-            c = vdist(verts[f[2]], verts[f[0]])
-            a2 = a**2
-            b2 = b**2
-            c2 = c**2
-            a4 = a**4
-            b4 = b**4
-            c4 = c**4
-            num = a * b * c
-            denom = sqrt(2 * a2 * b2 + 2 * b2 * c2 + 2 * c2 * a2 - a4 - b4 - c4)
-            fradii.append(num/denom)
-        self.fradii = fradii
+        metrics = face_metrics(self.verts, self.faces)
+        self.fradii = metrics[3]
+        self.degenerate = metrics[4]
 
     def flip_yz(self):
         """
-        Switch Y axis with Z axis
+        Switch Y axis with Z axis of verts and, if present, vnorms,
+        fnorms and centers
         """
-        verts = self.verts
-        new_verts = list()
-        for v in verts:
-            # no fancy slicing here, v is a tuple
-            x = v[0]
-            y = v[1]
-            z = v[2]
-            v = (x, z, y)
-            new_verts.append(v)
-        self.verts = new_verts
+        for name in ('verts', 'vnorms', 'fnorms', 'centers'):
+            vecs = getattr(self, name, None)
+            if vecs is not None:
+                setattr(self, name, [swap_yz(v) for v in vecs])
 
     def flip_v(self):
         """
@@ -299,6 +621,221 @@ class Mesh:
         self.uv = new_uv
 
 
+def _to_vectors(value, width=3):
+    if isinstance(value, VectorView):
+        return value
+    if isinstance(value, array):
+        return VectorView(value, width)
+    data = array('f')
+    for v in value:
+        data.extend(v)
+    return VectorView(data, width)
+
+
+def _to_ragged(value, typecode='i', width=1):
+    if isinstance(value, RaggedView):
+        return value
+    return RaggedView.from_lists(value, typecode, width)
+
+
+def _to_optional_ints(value):
+    if isinstance(value, OptionalIntView):
+        return value
+    return OptionalIntView(array('i', [-1 if n is None else n for n in value]))
+
+
+def _array_property(name, convert):
+    def fget(self):
+        try:
+            return self._arrays[name]
+        except KeyError:
+            raise AttributeError(name)
+    def fset(self, value):
+        self._arrays[name] = convert(value)
+    return property(fget, fset)
+
+
+class ArrayMesh(Mesh):
+    """
+    A Mesh stored as flat arrays instead of lists of tuples
+
+    The usual Mesh attributes are views (VectorView, RaggedView,
+    OptionalIntView or plain arrays) over 32-bit float and int arrays;
+    face lists, normal indices and UVs are stored as one flat array each
+    plus an array of face start offsets.  Assigning lists to any of the
+    attributes converts them.  Use for large models, where a list of
+    tuples costs around ten times as much memory as the packed floats.
+
+    vert_data, vnorm_data, face_data, uv_data - the flat arrays behind
+        verts, vnorms, faces and uv
+    face_starts - offsets into face_data (and fvnorms and uv) for each face,
+        plus the total number of corners at the end
+    """
+    def __init__(self):
+        self._arrays = dict()
+
+    @classmethod
+    def from_mesh(cls, m):
+        """
+        Makes an ArrayMesh with the same attributes as Mesh m
+        """
+        new_mesh = cls()
+        for name in cls._ARRAY_ATTRS:
+            if hasattr(m, name):
+                setattr(new_mesh, name, getattr(m, name))
+        return new_mesh
+
+    verts = _array_property('verts', _to_vectors)
+    vnorms = _array_property('vnorms', _to_vectors)
+    fnorms = _array_property('fnorms', _to_vectors)
+    centers = _array_property('centers', _to_vectors)
+    faces = _array_property('faces', _to_ragged)
+    fvnorms = _array_property('fvnorms', _to_ragged)
+    vnorms_by_vert = _array_property('vnorms_by_vert', _to_ragged)
+    uv = _array_property('uv', lambda value: _to_ragged(value, 'f', 2))
+    tex_ids = _array_property('tex_ids', _to_optional_ints)
+    num_norms = _array_property('num_norms', lambda value: array('i', value))
+    fradii = _array_property('fradii', lambda value: array('f', value))
+    areas = _array_property('areas', lambda value: array('f', value))
+    degenerate = _array_property('degenerate', lambda value: array('B', value))
+
+    _ARRAY_ATTRS = ('verts', 'vnorms', 'fnorms', 'centers', 'faces', 'fvnorms',
+                    'vnorms_by_vert', 'uv', 'tex_ids', 'num_norms', 'fradii',
+                    'areas', 'degenerate')
+
+    @property
+    def vert_data(self):
+        return self.verts.data
+
+    @property
+    def vnorm_data(self):
+        return self.vnorms.data
+
+    @property
+    def face_data(self):
+        return self.faces.data
+
+    @property
+    def face_starts(self):
+        return self.faces.starts
+
+    @property
+    def uv_data(self):
+        return self.uv.data
+
+    def calc_face_metrics(self):
+        metrics = face_metrics(self.verts, self.faces, as_arrays=True)
+        self.centers, self.fnorms, self.areas, self.fradii, self.degenerate = metrics
+        if any(self.degenerate):
+            logging.warning("Mesh has {} degenerate faces".format(sum(self.degenerate)))
+
+    def calc_fradii(self):
+        metrics = face_metrics(self.verts, self.faces, as_arrays=True)
+        self.fradii = metrics[3]
+        self.degenerate = metrics[4]
+
+    def flip_yz(self):
+        # in place, no second copy of the geometry
+        for name in ('verts', 'vnorms', 'fnorms', 'centers'):
+            vecs = self._arrays.get(name)
+            if vecs is not None:
+                swap_columns(vecs.data, 3, 1, 2)
+
+    def flip_v(self):
+        negate_column(self.uv.data, 2, 1)
+
+
+class MeshAdjacency:
+    """
+    Edge and face connectivity of a face list, built once in linear time
+
+    edges are identified by index, numbered in order of first use going
+    through the faces corner by corner
+
+    edge_verts - array of vert index pairs, lower index first, two per edge
+    edge_index - dict of (lower vert, higher vert) : edge index
+    face_edges - list per face of edge indices, edge k running from
+        corner k to corner k + 1
+    edge_faces - list per edge of the faces using it
+    vert_faces - list per vert of the faces using it
+    """
+    def __init__(self, faces, num_verts=0):
+        self.faces = faces
+        edge_verts = array('i')
+        edge_index = dict()
+        face_edges = list()
+        edge_faces = list()
+        vert_faces = [list() for i in range(num_verts)]
+        for i, f in enumerate(faces):
+            these_edges = list()
+            n = len(f)
+            for k in range(n):
+                a = f[k]
+                b = f[(k + 1) % n]
+                if a > b:
+                    a, b = b, a
+                key = (a, b)
+                e = edge_index.get(key)
+                if e is None:
+                    e = len(edge_faces)
+                    edge_index[key] = e
+                    edge_verts.append(a)
+                    edge_verts.append(b)
+                    edge_faces.append([i])
+                else:
+                    edge_faces[e].append(i)
+                these_edges.append(e)
+                v = f[k]
+                while v >= len(vert_faces):
+                    vert_faces.append(list())
+                vert_faces[v].append(i)
+            face_edges.append(these_edges)
+        self.edge_verts = edge_verts
+        self.edge_index = edge_index
+        self.face_edges = face_edges
+        self.edge_faces = edge_faces
+        self.vert_faces = vert_faces
+
+    def __len__(self):
+        return len(self.edge_faces)
+
+    def get_edge(self, a, b):
+        """
+        Returns the index of the edge between verts a and b, or None
+        """
+        if a > b:
+            a, b = b, a
+        return self.edge_index.get((a, b))
+
+    def face_neighbors(self, i):
+        """
+        Returns a list with the face across each edge of face i,
+        or -1 where there isn't one
+        """
+        neighbors = list()
+        edge_faces = self.edge_faces
+        for e in self.face_edges[i]:
+            for j in edge_faces[e]:
+                if j != i:
+                    neighbors.append(j)
+                    break
+            else:
+                neighbors.append(-1)
+        return neighbors
+
+    def boundary_edges(self):
+        """
+        Returns the indices of edges used by only one face
+        """
+        return [e for e, faces in enumerate(self.edge_faces) if len(faces) == 1]
+
+    def nonmanifold_edges(self):
+        """
+        Returns the indices of edges used by more than two faces
+        """
+        return [e for e, faces in enumerate(self.edge_faces) if len(faces) > 2]
+
+
 ## POF helpers ##
 
 
@@ -315,7 +852,7 @@ class PolyModel:
             if chunk.CHUNK_ID == b'HDR2' or chunk.CHUNK_ID == b'OHDR':
                 self.header = chunk
             if chunk.CHUNK_ID == b'OBJ2' or chunk.CHUNK_ID == b'SOBJ':
-                print(chunk.model_id)
+                logging.debug("Found submodel {}".format(chunk.model_id))
                 self.submodels[chunk.model_id] = chunk
             elif chunk.CHUNK_ID == b' EYE' or chunk.CHUNK_ID == b'EYE ':
                 self.chunks['EYE'] = chunk
@@ -476,7 +1013,7 @@ class PolyModel:
         if "PATH" in chunks:
             path = chunks["PATH"]
             for p in path.path_parents:
-                if not self.get_submodel_by_name(p) and p != b'':
+                if p and self.get_submodel_by_name(p) is None:
                     raise InvalidChunkError(path, "Path parent not found, {}".format(p))
             for i, p in enumerate(path.turret_sobj_num):
                 for v in p:
@@ -503,7 +1040,7 @@ class PolyModel:
                     i in header.sobj_debris or
                     i in header.sobj_detail_levels):
                     raise InvalidChunkError(chunks["TGUN"], "Barrel submodel does not exist or is not a turret, turret {}".format(j))
-            for j, i in enumerate(chunk["TGUN"].base_sobj):
+            for j, i in enumerate(chunks["TGUN"].base_sobj):
                 if (i > header.num_subobjects or
                     i in header.sobj_debris or
                     i in header.sobj_detail_levels):
@@ -514,7 +1051,7 @@ class PolyModel:
                     i in header.sobj_debris or
                     i in header.sobj_detail_levels):
                     raise InvalidChunkError(chunks["TMIS"], "Barrel submodel does not exist or is not a turret, turret {}".format(j))
-            for j, i in enumerate(chunk["TMIS"].base_sobj):
+            for j, i in enumerate(chunks["TMIS"].base_sobj):
                 if (i > header.num_subobjects or
                     i in header.sobj_debris or
                     i in header.sobj_detail_levels):
@@ -550,10 +1087,17 @@ class PolyModel:
         self.submodels = submodels
 
     def get_submodel_by_name(self, name):
-        name = bytes(name, "utf-8")
+        # names read from a file are bytes, names set by the exporter are
+        # str; the engine doesn't care about case
+        if isinstance(name, str):
+            name = bytes(name, "utf-8")
+        name = name.lower()
 
         for model in self.submodels.values():
-            if model.model_id == name:
+            model_name = model.name
+            if isinstance(model_name, str):
+                model_name = bytes(model_name, "utf-8")
+            if model_name.lower() == name:
                 return model
         else:
             return None
@@ -561,6 +1105,8 @@ class PolyModel:
 
 class POFChunk:
     """Base class for all POF chunks.  Calling len() on a chunk will return the estimated size of the packed binary chunk, minus chunk header."""
+    # BSP blocks add their own slots; there can be hundreds of thousands of them
+    __slots__ = ('pof_ver',)
     CHUNK_ID = b"PSPO"
     def __init__(self, pof_ver=2117, chunk_id=b'PSPO'):
         self.pof_ver = pof_ver
@@ -1027,9 +1573,12 @@ class ShieldChunk(POFChunk):
 
         return chunk
 
-    def get_mesh(self):
+    def get_mesh(self, arrays=False):
 
-        shld_mesh = Mesh()
+        if arrays:
+            shld_mesh = ArrayMesh()
+        else:
+            shld_mesh = Mesh()
         shld_mesh.verts = self.vert_list
         shld_mesh.faces = self.face_list
         return shld_mesh
@@ -1043,25 +1592,23 @@ class ShieldChunk(POFChunk):
         face_list = m.faces
         self.face_normals = m.fnorms
         
-        # for getting neighbors, we could:
-        # for each face
-            # for each pair of verts
-                # for each face
-                    # if pair of verts in face, add neighbor
-
-        face_neighbors = list()
-        for i, f in enumerate(face_list):
-            face_neighbors.append(list())
-            e1 = {f[0], f[1]}
-            e2 = {f[1], f[2]}
-            e3 = {f[2], f[0]}
-            for j, n in enumerate(face_list):
-                v = set(n)
-                if e1 < v or e2 < v or e3 < v:
-                    face_neighbors[i].append(j)
+        # the engine wants exactly one neighbor across each edge,
+        # -1 where there isn't one
+        adj = m.get_adjacency()
+        face_neighbors = [adj.face_neighbors(i) for i in range(len(face_list))]
+
+        edge_verts = adj.edge_verts
+        boundary_edges = [(edge_verts[2 * e], edge_verts[2 * e + 1]) for e in adj.boundary_edges()]
+        nonmanifold_edges = [(edge_verts[2 * e], edge_verts[2 * e + 1]) for e in adj.nonmanifold_edges()]
+        if boundary_edges:
+            logging.warning("Shield has {} boundary edges, faces along them will have no neighbor".format(len(boundary_edges)))
+        if nonmanifold_edges:
+            logging.warning("Shield has {} edges shared by more than two faces".format(len(nonmanifold_edges)))
 
         self.face_list = face_list
         self.face_neighbors = face_neighbors
+        self.boundary_edges = boundary_edges
+        self.nonmanifold_edges = nonmanifold_edges
 
     def __len__(self):
         try:
@@ -1432,6 +1979,21 @@ class ModelChunk(POFChunk):
             self.CHUNK_ID = b"SOBJ"
 
         self.pof_ver = pof_ver
+        self._bsp_tree = None
+        self.bsp_data = None
+
+    @property
+    def bsp_tree(self):
+        """The BSP data as a list of blocks, unpacked the first time it's asked for."""
+        if self._bsp_tree is None and self.bsp_data is not None:
+            self._bsp_tree = self._read_bsp(RawData(self.bsp_data))
+        return self._bsp_tree
+
+    @bsp_tree.setter
+    def bsp_tree(self, bsp_tree):
+        # the blocks are the real data now
+        self._bsp_tree = bsp_tree
+        self.bsp_data = None
 
     def read_chunk(self, bin_data):
         pof_ver = self.pof_ver
@@ -1461,14 +2023,18 @@ class ModelChunk(POFChunk):
 
         bin_data.seek(4, 1)     # int reserved, must be 0
         bsp_size = unpack_int(bin_data.read(4))
-        bsp_tree = list()       # we'll unpack the BSP data as a list of chunks
 
-        bsp_addr = bin_data.tell()
-        self.bsp_data = bin_data.read(bsp_size)     # keep a packed version for caching purposes
-        bin_data.seek(bsp_addr)
+        # keep it packed until someone asks for blocks, parsed blocks take
+        # many times the memory
+        self._bsp_tree = None
+        self.bsp_data = bin_data.read(bsp_size)
 
         logging.debug("BSP data size {}".format(bsp_size))
 
+    def _read_bsp(self, bin_data):
+        """Unpacks BSP data as a list of blocks."""
+        bsp_tree = list()
+
         while True:
             block_addr = bin_data.tell()
             eof_test = bin_data.read(4)
@@ -1486,7 +2052,7 @@ class ModelChunk(POFChunk):
             else:       # EOF
                 break
 
-        self.bsp_tree = bsp_tree
+        return bsp_tree
 
     def write_chunk(self):
         chunk = self.CHUNK_ID
@@ -1521,11 +2087,7 @@ class ModelChunk(POFChunk):
         chunk += pack_int(self.movement_axis)
         chunk += b'\0\0\0\0'
 
-        bsp_data = b""
-        bsp_tree = self.bsp_tree
-
-        for block in bsp_tree:
-            bsp_data += block.write_chunk()
+        bsp_data = self._get_bsp_data()
 
         logging.debug("And BSP data size {}...".format(len(bsp_data)))
         chunk += pack_int(len(bsp_data))
@@ -1533,8 +2095,37 @@ class ModelChunk(POFChunk):
 
         return chunk
 
-    def get_mesh(self):
-        """Returns a mesh object."""
+    def _get_bsp_data(self):
+        if self._bsp_tree is None and self.bsp_data is not None:
+            return self.bsp_data
+        return b"".join([block.write_chunk() for block in self.bsp_tree])
+
+    def geometry_fingerprint(self):
+        """Returns a hex digest of the packed BSP data.  Submodels with the same
+        digest have identical geometry relative to their offsets."""
+        return hashlib.sha1(self._get_bsp_data()).hexdigest()
+
+    def share_bsp(self, other):
+        """Uses the BSP data, bounding box, center and radius of ModelChunk
+        other instead of building a tree, for submodels with the same mesh."""
+        self.min = other.min
+        self.max = other.max
+        self.center = other.center
+        self.radius = other.radius
+        self.bsp_tree = None
+        self.bsp_data = other._get_bsp_data()
+
+    def get_polygons(self):
+        """Returns a PolygonBuffer of all polygons in the BSP data."""
+        if self._bsp_tree is None and self.bsp_data is not None:
+            return PolygonBuffer.from_bsp_data(self.bsp_data)
+        return PolygonBuffer.from_bsp_tree(self.bsp_tree)
+
+    def get_mesh(self, arrays=False):
+        """Returns a mesh object, an ArrayMesh if arrays is True."""
+        if arrays:
+            return self._get_array_mesh()
+
         bsp_tree = self.bsp_tree
         raw_faces = list()
 
@@ -1574,10 +2165,41 @@ class ModelChunk(POFChunk):
 
         return m
 
-    def set_mesh(self, m):
+    def _get_array_mesh(self):
+        # same as get_mesh(), but straight into flat arrays, without
+        # unpacking any more blocks than the defpoints
+        if self._bsp_tree is None and self.bsp_data is not None:
+            bin_data = RawData(self.bsp_data)
+            block_id = unpack_int(bin_data.read(4))
+            block_size = unpack_int(bin_data.read(4))
+            defpoints = DefpointsBlock()
+            if block_id == 1:
+                defpoints.read_chunk(RawData(bin_data.read(block_size - 8)))
+        else:
+            defpoints = [node for node in self.bsp_tree if node.CHUNK_ID == 1][0]
+        polys = self.get_polygons()
+
+        m = ArrayMesh()
+        m.verts = defpoints.vert_list
+        m.num_norms = defpoints.norm_counts
+        face_data = array('i', polys.vert_ids)
+        face_starts = polys.starts
+        uv_data = array('f', [0.0]) * (2 * len(face_data))
+        uv_data[0::2] = polys.u
+        uv_data[1::2] = polys.v
+        m.faces = RaggedView(face_data, face_starts)
+        m.uv = RaggedView(uv_data, face_starts, 2)
+        m.tex_ids = OptionalIntView(polys.texture_ids)
+        return m
+
+    def set_mesh(self, m, jobs=1, cache=None):
         """Creates a BSP tree as a list of blocks.
         
-        May take a few minutes, depending on size of the model, so get some coffee."""
+        May take a few minutes, depending on size of the model, so get some coffee.
+        If jobs > 1, the top of the tree is split serially and the subtrees below
+        it are built in that many worker processes.  If cache is a
+        bspcache.BSPCache, a tree previously built from identical geometry
+        is reused instead of being built again."""
         # Basically:
         # defpoints = DefpointsBlock()
         # defpoints.set_mesh(m)
@@ -1587,6 +2209,17 @@ class ModelChunk(POFChunk):
         # self._generate_tree_recursion()
         # self.bsp_tree = self._defpoints + self._polylist
         
+        if cache is not None:
+            key = cache.fingerprint(m)
+            cached = cache.get(key)
+            if cached is not None:
+                self.min, self.max, bsp_data = cached
+                self.center = self._get_split_plane(self.max, self.min)[0]
+                self.radius = vdist(self.max, self.center)
+                self.bsp_tree = None
+                self.bsp_data = bsp_data
+                return
+
         m.calc_fradii()
         
         defpoints = DefpointsBlock()
@@ -1625,10 +2258,18 @@ class ModelChunk(POFChunk):
         #self.center = m.obj_ctr
         self.radius = vdist(self.max, self.center)
         self.bsp_tree = list()
-        self._generate_tree_recursion(face_list)
+        if jobs > 1 and len(face_list) >= BSP_PARALLEL_MIN_FACES:
+            self._generate_tree_parallel(face_list, jobs)
+        else:
+            self._generate_tree_recursion(face_list)
+        _set_bsp_offsets(self.bsp_tree)
         self.bsp_tree.insert(0, self._defpoints)
         self.bsp_tree.append(EndBlock())
 
+        if cache is not None:
+            self.bsp_data = b"".join([block.write_chunk() for block in self.bsp_tree])
+            cache.put(key, self.min, self.max, self.bsp_data)
+
     def _add_faces(self, face_list):
         bsp_tree = self.bsp_tree
         defpoints = self._defpoints.vert_list
@@ -1691,19 +2332,16 @@ class ModelChunk(POFChunk):
             node_norm = vector(0, 0, 1)
         return list(ctr_pnt), max_axis, node_norm
 
-    def _generate_tree_recursion(self, face_list):
-        if not len(face_list):
-            # nothing to do...
-            return
+    def _choose_split(self, face_list):
+        """Returns (front_list, back_list, max_pnt, min_pnt, ctr_pnt, node_norm)
+        for a sortnorm, or None if the faces should go in a leaf."""
         # if only one, make a face
         if len(face_list) == 1:
-            self._add_faces(face_list)
             return None
         elif len(face_list) == 2:
             if face_list[0].center == face_list[1].center:
                 # make a face
-                self._add_faces(face_list)
-                return
+                return None
             # we cheat and make the split based on the polys
             ax = face_list[0].center[0]     # first face center
             ay = face_list[0].center[1]
@@ -1740,8 +2378,7 @@ class ModelChunk(POFChunk):
                 real_tries += 1     # does not get decremented
                 if real_tries > 500:
                     # panic, just dump polys into unordered list
-                    self._add_faces(face_list)
-                    return
+                    return None
                 on_back = False
                 if bnum:
                     if not on_back:     # bnum was zero, but now fnum is zero
@@ -1783,39 +2420,76 @@ class ModelChunk(POFChunk):
 
             # something bad happened and an empty list slipped through
             if not fnum or not bnum:
-                self._add_faces(face_list)
-                return
-        # get actual min, max, make sortnorm
+                return None
+        # get actual min, max
         if not max_pnt or not min_pnt:
             # only called if 2 faces in list
             max_pnt, min_pnt = self._get_bounds(face_list)
+        return front_list, back_list, max_pnt, min_pnt, ctr_pnt, node_norm
+
+    def _generate_tree_recursion(self, face_list, depth=None, subtrees=None):
+        """Appends the tree for face_list to self.bsp_tree.
+
+        If depth is given, stops that many levels down and leaves a
+        placeholder in the tree for each remaining face list, which is
+        appended to subtrees as (placeholder index, face list).
+        Sortnorm back offsets are filled in afterwards by _set_bsp_offsets()."""
+        if not len(face_list):
+            # nothing to do...
+            return
+        if depth == 0 and len(face_list) > 1:
+            subtrees.append((len(self.bsp_tree), face_list))
+            self.bsp_tree.append(None)
+            return
+        split = self._choose_split(face_list)
+        if split is None:
+            self._add_faces(face_list)
+            return
+        front_list, back_list, max_pnt, min_pnt, ctr_pnt, node_norm = split
+        if depth is not None:
+            depth -= 1
         bsp_tree = self.bsp_tree
         cur_node = SortnormBlock()
         cur_node.max = max_pnt
         cur_node.min = min_pnt
         cur_node.plane_normal = node_norm
         cur_node.plane_point = ctr_pnt
-        cur_idx = len(bsp_tree)
         bsp_tree.append(cur_node)
         for i in range(3):
             bsp_tree.append(EndBlock())
-        # recurse into front list
-        self.bsp_tree = bsp_tree
-        self._generate_tree_recursion(front_list)
-        # get back offset
-        back_offset = 0
+        # recurse into front list, then back list
+        self._generate_tree_recursion(front_list, depth, subtrees)
+        self._generate_tree_recursion(back_list, depth, subtrees)
+
+    def _generate_tree_parallel(self, face_list, jobs):
+        """Splits the top of the tree serially, then builds the subtrees
+        below it in a pool of worker processes and splices them back in."""
+        # a few more subtrees than workers evens out lopsided splits
+        depth = 1
+        while 2 ** depth < 4 * jobs:
+            depth += 1
+        subtrees = list()
+        self._generate_tree_recursion(face_list, depth, subtrees)
+        logging.debug("Building {} BSP subtrees in {} processes".format(len(subtrees), jobs))
+        pool = multiprocessing.Pool(jobs, _init_bsp_worker, (self._defpoints.vert_list,))
+        try:
+            results = pool.map(_build_bsp_subtree, [s[1] for s in subtrees], 1)
+        finally:
+            pool.close()
+            pool.join()
+        # splice from the end so earlier placeholder indices stay valid
         bsp_tree = self.bsp_tree
-        for node in bsp_tree[cur_idx:]:
-            back_offset += len(node)
-        self.bsp_tree[cur_idx].back_offset = back_offset
-        # recurse into back list
-        self._generate_tree_recursion(back_list)
+        for (idx, faces), subtree in reversed(list(zip(subtrees, results))):
+            bsp_tree[idx:idx + 1] = subtree
+        self.bsp_tree = bsp_tree
 
     def __len__(self):
         chunk_length = 84
         try:
             chunk_length += len(self.name)
             chunk_length += len(self.properties)
+            if self._bsp_tree is None and self.bsp_data is not None:
+                return chunk_length + len(self.bsp_data)
             bsp_tree = self.bsp_tree
             for block in bsp_tree:
                 if block.CHUNK_ID == 0:
@@ -2063,31 +2737,7 @@ class GlowChunk(POFChunk):
 class TreeChunk(POFChunk):
     CHUNK_ID = b"SLDC"
     def read_chunk(self, bin_data):
-        tree_size = unpack_uint(bin_data.read(4))
-        shield_tree = list()
-
-        while True:
-            node_type = unpack_ubyte(bin_data.read(1))
-            eof_test = bin_data.read(4)
-            if eof_test == b"":
-                break
-            if not node_type:
-                this_node = ShieldSplit()
-                this_node.min = unpack_vector(bin_data.read(12))
-                this_node.max = unpack_vector(bin_data.read(12))
-                this_node.front = unpack_uint(bin_data.read(4))
-                this_node.back = unpack_uint(bin_data.read(4))
-            else:
-                this_node = ShieldLeaf()
-                this_node.min = unpack_vector(bin_data.read(12))
-                this_node.max = unpack_vector(bin_data.read(12))
-                num_polygons = unpack_uint(bin_data.read(4))
-                face_list = list()
-                for i in range(num_polygons):
-                    face_list.append(unpack_uint(bin_data.read(4)))
-                this_node.face_list = face_list
-            shield_tree.append(this_node)
-            self.shield_tree = shield_tree
+        self.tree = ShieldTree.unpack(bin_data.read())
 
     def write_chunk(self):
         chunk = self.CHUNK_ID
@@ -2098,26 +2748,15 @@ class TreeChunk(POFChunk):
             return False
         logging.debug("Writing shield collision tree with size {}...".format(length))
         chunk += pack_uint(length - 4)
-
-        shield_tree = self.shield_tree
-
-        for node in shield_tree:
-            chunk += pack_ubyte(node.node_type)
-            chunk += pack_uint(len(node))
-
-            if node.node_type:
-                chunk += pack_float(node.min)
-                chunk += pack_float(node.max)
-
-                face_list = node.face_list
-                num_polygons = len(face_list)
-                chunk += pack_uint(num_polygons)
-
-                for f in face_list:
-                    chunk += pack_uint(f)
+        chunk += self.tree.pack()
 
         return chunk
 
+    @property
+    def shield_tree(self):
+        """The tree as a list of ShieldSplit and ShieldLeaf nodes, in file order."""
+        return self.tree.get_nodes()
+
     def make_shield_collision_tree(self, shield_chunk=None, m=None):
         """Should be called if any geometry on the shield is modified."""
         if m is not None:
@@ -2129,231 +2768,265 @@ class TreeChunk(POFChunk):
             else:
                 raise InvalidChunkError(self, "Must have either shield chunk or mesh")
 
-        face_list = m.faces     # Hopefully the same index as the shield chunk
-        vert_list = m.verts
-        faces = list()
-        for i, f in enumerate(face_list):
-            verts = list()
-            for v in f:
-                verts.append(vert_list[v])
-            faces.append(ShieldFace(verts, i))
+        # face indices are hopefully the same as the shield chunk's
+        self.tree = ShieldTree.build(m.verts, m.faces)
 
-        self.shield_tree = list()
-        self._generate_tree_recursion(faces)
+    def __len__(self):
+        try:
+            return 4 + len(self.tree)
+        except AttributeError:
+            return 0
 
-    def _add_faces(self, face_list):
-        cur_node = ShieldLeaf()
-        max_pnt, min_pnt = self._get_bounds(face_list)
-        cur_node.max = max_pnt
-        cur_node.min = min_pnt
-        for f in face_list:
-            cur_node.face_list.append(f.face_idx)
-        self.shield_tree.append(cur_node)
 
-    def _make_split(self, ctr_pnt, max_axis, face_list):
-        front_list = list()
-        back_list = list()
-        for f in face_list:
-            if f.center[max_axis] >= ctr_pnt[max_axis]:
-                front_list.append(f)
-            else:
-                back_list.append(f)
-        return front_list, back_list
+class ShieldTree:
 
-    def _get_bounds(self, face_list):
-        verts_x = list()
-        verts_y = list()
-        verts_z = list()
-        for f in face_list:
-            for v in f.vert_list:
-                verts_x.append(v[0])
-                verts_y.append(v[1])
-                verts_z.append(v[2])
-        max_x = max(verts_x) + 0.1
-        max_y = max(verts_y) + 0.1
-        max_z = max(verts_z) + 0.1
-        min_x = min(verts_x) - 0.1
-        min_y = min(verts_y) - 0.1
-        min_z = min(verts_z) - 0.1
-        max_pnt = vector(max_x, max_y, max_z)
-        min_pnt = vector(min_x, min_y, min_z)
-        return max_pnt, min_pnt
+    """Shield collision tree stored as flat arrays, one entry per node, in file order (each split is followed by its front subtree, then its back subtree).
 
-    def _get_split_plane(self, max_pnt, min_pnt):
-        dx = max_pnt[0] - min_pnt[0]
-        dy = max_pnt[1] - min_pnt[1]
-        dz = max_pnt[2] - min_pnt[2]
-        cx = min_pnt[0] + dx / 2
-        cy = min_pnt[1] + dy / 2
-        cz = min_pnt[2] + dz / 2
-        ctr_pnt = vector(cx, cy, cz)
-        if max([dx, dy, dz]) is dx:
-            max_axis = 0
-            node_norm = vector(1, 0, 0)
-        elif max([dx, dy, dz]) is dy:
-            max_axis = 1
-            node_norm = vector(0, 1, 0)
-        elif max([dx, dy, dz]) is dz:
-            max_axis = 2
-            node_norm = vector(0, 0, 1)
-        return list(ctr_pnt), max_axis, node_norm
+    Attributes:
+        node_type -- 0 for a split, 1 for a leaf
+        node_bounds -- min x, y, z then max x, y, z for each node
+        node_front, node_back -- child node indices for splits, -1 for leaves
+        node_first, node_count -- range of each leaf's entries in faces
+        faces -- shield face indices for all leaves
+
+    Methods:
+        build(verts, faces) -- Returns a new tree for a shield mesh.
+        unpack(data) -- Returns a tree read from packed SLDC data, tree size included.
+        pack() -- Returns the packed nodes, without the tree size.
+        get_nodes() -- Returns the nodes as ShieldSplit and ShieldLeaf objects."""
+
+    def __init__(self):
+        self.node_type = array('B')
+        self.node_bounds = array('f')
+        self.node_front = array('i')
+        self.node_back = array('i')
+        self.node_first = array('I')
+        self.node_count = array('I')
+        self.faces = array('I')
 
-    def _generate_tree_recursion(self, face_list):
-        if not len(face_list):
-            # nothing to do...
-            return
-        # if only one, make a face
-        if len(face_list) == 1:
-            self._add_faces(face_list)
-            return None
-        elif len(face_list) == 2:
-            if face_list[0].center == face_list[1].center:
-                # make a face
-                self._add_faces(face_list)
-                return
-            # we cheat and make the split based on the polys
-            ax = face_list[0].center[0]     # first face center
-            ay = face_list[0].center[1]
-            az = face_list[0].center[2]
-            bx = face_list[1].center[0]     # second face center
-            by = face_list[1].center[1]
-            bz = face_list[1].center[2]
-            max_x = max([ax, bx])           # max point
-            max_y = max([ay, by])
-            max_z = max([az, bz])
-            max_pnt = vector(max_x, max_y, max_z)
-            min_x = min([ax, bx])           # min point
-            min_y = min([ay, by])
-            min_z = min([az, bz])
-            min_pnt = vector(min_x, min_y, min_z)
-            ctr_pnt, max_axis, node_norm = self._get_split_plane(max_pnt, min_pnt)
-            front_list, back_list = self._make_split(ctr_pnt, max_axis, face_list)
-            max_pnt = False
-            min_pnt = False
-        else:
-            # get initial center point
-            max_pnt, min_pnt = self._get_bounds(face_list)
-            ctr_pnt, max_axis, node_norm = self._get_split_plane(max_pnt, min_pnt)
-            front_list, back_list = self._make_split(ctr_pnt, max_axis, face_list)
-            fnum = len(front_list)
-            bnum = len(back_list)
-            num_tries = 0
-            real_tries = 0
-            ratio = 2.0
-            while not fnum or not bnum:
-                # one of them doesn't have polys
-                # make a new split point based on the one that does
-                num_tries += 1
-                real_tries += 1     # does not get decremented
-                if real_tries > 500:
-                    # panic, just dump polys into unordered list
-                    self._add_faces(face_list)
-                    return
-                on_back = False
-                if bnum:
-                    if not on_back:     # bnum was zero, but now fnum is zero
-                        on_back = True
-                        num_tries = 1
-                        ratio *= 0.5    # we'll have to use a smaller amount
-                    bmax, bmin = self._get_bounds(back_list)
-                    ctr_pnt, max_axis, node_norm = self._get_split_plane(bmax, bmin)
-                    ctr_pnt[max_axis] += (-0.01 * ratio) * num_tries
-                    front_list, back_list = self._make_split(ctr_pnt, max_axis, back_list)
-                else:
-                    if on_back:
-                        on_back = False
-                        num_tries = 1
-                        ratio *= 0.5
-                    fmax, fmin = self._get_bounds(front_list)
-                    ctr_pnt, max_axis, node_norm = self._get_split_plane(fmax, fmin)
-                    ctr_pnt[max_axis] += (0.01 * ratio) * num_tries
-                    front_list, back_list = self._make_split(ctr_pnt, max_axis, front_list)
-                fnum = len(front_list)
-                bnum = len(back_list)
-            num_tries = 0
-            while num_tries <= 15 and (
-                fnum + bnum != len(face_list) or
-                fnum - bnum > 0.05 * (fnum + bnum) + 1 or
-                (not fnum or not bnum)
-            ):
-                num_tries += 1
-                if fnum > bnum:
-                    front = 1
-                else:
-                    front = -1
-                delta = max_pnt[max_axis] - min_pnt[max_axis]
-                # move ctr pnt towards longest list:
-                ctr_pnt[max_axis] += front * (delta / (num_tries + 1) ** 2)
-                front_list, back_list = self._make_split(ctr_pnt, max_axis, face_list)
-                fnum = len(front_list)
-                bnum = len(back_list)
+    def __len__(self):
+        num_splits = self.node_type.count(0)
+        return 37 * num_splits + 33 * (len(self.node_type) - num_splits) + 4 * len(self.faces)
 
-            # something bad happened and an empty list slipped through
-            if not fnum or not bnum:
-                self._add_faces(face_list)
-                return
-        # get actual min, max, make sortnorm
-        if not max_pnt or not min_pnt:
-            # only called if 2 faces in list
-            max_pnt, min_pnt = self._get_bounds(face_list)
-        shield_tree = self.shield_tree
-        cur_node = ShieldSplit()
-        cur_node.max = max_pnt
-        cur_node.min = min_pnt
-        cur_idx = len(shield_tree)
-        shield_tree.append(cur_node)
-        # recurse into front list
-        self.shield_tree = shield_tree
-        self._generate_tree_recursion(front_list)
-        # get back offset
-        back_offset = 0
-        shield_tree = self.shield_tree
-        for node in shield_tree[cur_idx:]:
-            back_offset += len(node)
-        self.shield_tree[cur_idx].back_offset = back_offset
-        # recurse into back list
-        self._generate_tree_recursion(back_list)
+    def __repr__(self):
+        return "<ShieldTree with {} nodes>".format(len(self.node_type))
+
+    def _add_node(self, node_type, bounds):
+        self.node_type.append(node_type)
+        self.node_bounds.extend(bounds)
+        self.node_front.append(-1)
+        self.node_back.append(-1)
+        self.node_first.append(len(self.faces))
+        self.node_count.append(0)
+        return len(self.node_type) - 1
+
+    @classmethod
+    def build(cls, verts, faces):
+        """Splits at the midpoint of the face centers' bounds on their longest
+        axis, or at the median if that leaves one side nearly empty, until
+        each leaf has a single face or faces with the same center."""
+        tree = cls()
+        node_front = tree.node_front
+        node_back = tree.node_back
+
+        # per-face bounds and centers, computed once
+        face_min = list()
+        face_max = list()
+        centers = list()
+        for f in faces:
+            xs = [verts[v][0] for v in f]
+            ys = [verts[v][1] for v in f]
+            zs = [verts[v][2] for v in f]
+            face_min.append((min(xs), min(ys), min(zs)))
+            face_max.append((max(xs), max(ys), max(zs)))
+            centers.append((sum(xs) / len(xs), sum(ys) / len(ys), sum(zs) / len(zs)))
+
+        # (face indices, parent node, is back child), popped front first
+        stack = [(list(range(len(faces))), -1, False)] if faces else []
+        while stack:
+            face_list, parent, is_back = stack.pop()
+            bounds = (min(face_min[i][0] for i in face_list) - 0.1,
+                      min(face_min[i][1] for i in face_list) - 0.1,
+                      min(face_min[i][2] for i in face_list) - 0.1,
+                      max(face_max[i][0] for i in face_list) + 0.1,
+                      max(face_max[i][1] for i in face_list) + 0.1,
+                      max(face_max[i][2] for i in face_list) + 0.1)
+            split = None
+            if len(face_list) > 1:
+                split = cls._split(face_list, centers)
+            if split is None:
+                node = tree._add_node(1, bounds)
+                tree.faces.extend(face_list)
+                tree.node_count[node] = len(face_list)
+            else:
+                node = tree._add_node(0, bounds)
+                stack.append((split[1], node, True))
+                stack.append((split[0], node, False))
+            if parent >= 0:
+                if is_back:
+                    node_back[parent] = node
+                else:
+                    node_front[parent] = node
+
+        return tree
+
+    @staticmethod
+    def _split(face_list, centers):
+        # returns (front list, back list), or None to make a leaf
+        cmin = [min(centers[i][a] for i in face_list) for a in range(3)]
+        cmax = [max(centers[i][a] for i in face_list) for a in range(3)]
+        extent = [cmax[a] - cmin[a] for a in range(3)]
+        axis = extent.index(max(extent))
+        if not extent[axis]:
+            # all centers are the same
+            return None
+        mid = cmin[axis] + extent[axis] / 2
+        front_list = [i for i in face_list if centers[i][axis] >= mid]
+        back_list = [i for i in face_list if centers[i][axis] < mid]
+        if 10 * min(len(front_list), len(back_list)) < len(face_list):
+            # lopsided, split at the median instead so depth stays logarithmic
+            ordered = sorted(face_list, key=lambda i: centers[i][axis])
+            half = len(ordered) // 2
+            back_list = ordered[:half]
+            front_list = ordered[half:]
+        return front_list, back_list
 
-    def __len__(self):
-        chunk_length = 4
-        try:
-            shield_tree = self.shield_tree
-            for node in shield_tree:
-                chunk_length += len(node)
-            return chunk_length
-        except AttributeError:
-            return 0
+    def _get_addrs(self):
+        addrs = list()
+        addr = 0
+        node_type = self.node_type
+        node_count = self.node_count
+        for i in range(len(node_type)):
+            addrs.append(addr)
+            if node_type[i]:
+                addr += 33 + 4 * node_count[i]
+            else:
+                addr += 37
+        return addrs
+
+    def pack(self):
+        node_type = self.node_type
+        node_bounds = self.node_bounds
+        node_front = self.node_front
+        node_back = self.node_back
+        node_first = self.node_first
+        node_count = self.node_count
+        faces = self.faces
+        addrs = self._get_addrs()
+        data = list()
+        for i in range(len(node_type)):
+            bounds = node_bounds[6 * i:6 * i + 6]
+            if node_type[i]:
+                count = node_count[i]
+                first = node_first[i]
+                data.append(pack('<BI6fI', 1, 33 + 4 * count, *(list(bounds) + [count])))
+                data.append(faces[first:first + count].tobytes())
+            else:
+                # offsets are relative to the start of this node
+                data.append(pack('<BI6f2I', 0, 37, *(list(bounds) +
+                                 [addrs[node_front[i]] - addrs[i],
+                                  addrs[node_back[i]] - addrs[i]])))
+        return b"".join(data)
+
+    @classmethod
+    def unpack(cls, data):
+        tree = cls()
+        node_type = tree.node_type
+        node_bounds = tree.node_bounds
+        node_front = tree.node_front
+        node_back = tree.node_back
+        node_first = tree.node_first
+        node_count = tree.node_count
+        faces = tree.faces
+        tree_size = unpack_from('<I', data, 0)[0]
+        end = min(len(data), 4 + tree_size)
+        addr = 4
+        node_at = dict()
+        # both kinds of node share 33 bytes: type, size, bounds and either a
+        # leaf's face count or a split's front offset.  A leaf with no faces
+        # is no longer than that.
+        while addr + 33 <= end:
+            fields = unpack_from('<BI6fI', data, addr)
+            i = len(node_type)
+            node_at[addr - 4] = i
+            node_type.append(fields[0])
+            node_bounds.extend(fields[2:8])
+            node_first.append(len(faces))
+            if fields[0]:
+                count = fields[8]
+                if addr + 33 + 4 * count > end:
+                    raise InvalidBSPError(i, "Shield tree leaf runs past the end of the tree")
+                node_count.append(count)
+                node_front.append(-1)
+                node_back.append(-1)
+                faces.extend(unpack_from('<{}I'.format(count), data, addr + 33))
+                addr += 33 + 4 * count
+            else:
+                if addr + 37 > end:
+                    raise InvalidBSPError(i, "Shield tree split runs past the end of the tree")
+                node_count.append(0)
+                # relative offsets for now, turned into indices below
+                node_front.append(fields[8])
+                node_back.append(unpack_from('<I', data, addr + 33)[0])
+                addr += 37
+        addrs = tree._get_addrs()
+        for i in range(len(node_type)):
+            if not node_type[i]:
+                try:
+                    node_front[i] = node_at[addrs[i] + node_front[i]]
+                    node_back[i] = node_at[addrs[i] + node_back[i]]
+                except KeyError:
+                    raise InvalidBSPError(i, "Shield tree offset does not point at a node")
+        return tree
+
+    def get_nodes(self):
+        nodes = list()
+        addrs = self._get_addrs()
+        node_bounds = self.node_bounds
+        for i, node_type in enumerate(self.node_type):
+            if node_type:
+                node = ShieldLeaf()
+                first = self.node_first[i]
+                node.face_list = list(self.faces[first:first + self.node_count[i]])
+            else:
+                node = ShieldSplit()
+                node.front_offset = addrs[self.node_front[i]] - addrs[i]
+                node.back_offset = addrs[self.node_back[i]] - addrs[i]
+            node.min = tuple(node_bounds[6 * i:6 * i + 3])
+            node.max = tuple(node_bounds[6 * i + 3:6 * i + 6])
+            nodes.append(node)
+        return nodes
 
 
 class ShieldSplit:
+    __slots__ = ('min', 'max', 'front_offset', 'back_offset')
     node_type = 0
-    min = None
-    max = None
-    front_offset = 37
-    back_offset = None
+
+    def __init__(self):
+        self.min = None
+        self.max = None
+        self.front_offset = 37
+        self.back_offset = None
 
     def __len__(self):
         return 37
 
 
 class ShieldLeaf:
+    __slots__ = ('min', 'max', 'face_list')
     node_type = 1
-    min = None
-    max = None
-    face_list = list()
+
+    def __init__(self):
+        self.min = None
+        self.max = None
+        self.face_list = list()
 
     def __len__(self):
         return 33 + 4 * len(self.face_list)
 
 
-class ShieldFace:
-    def __init__(self, verts, idx):
-        self.vert_list = verts
-        self.center = vavg(verts)
-        self.face_idx = idx
-
-
 class EndBlock(POFChunk):
+    __slots__ = ()
     CHUNK_ID = 0
     def read_chunk(self, bin_data):
         pass
@@ -2366,6 +3039,7 @@ class EndBlock(POFChunk):
 
 
 class DefpointsBlock(POFChunk):
+    __slots__ = ('norm_counts', 'vert_list', 'vnorms', 'vnorms_by_vert')
     CHUNK_ID = 1
     def read_chunk(self, bin_data):
         num_verts = unpack_int(bin_data.read(4))
@@ -2385,18 +3059,19 @@ class DefpointsBlock(POFChunk):
 
         vert_list = list()
         vert_norms = list()
+        vnorms_by_vert = list()
+        norm_idx = dict()
 
         for i in range(num_verts):
             vert_list.append(unpack_vector(bin_data.read(12)))
-            #vert_norms.append(list())
+            vnorms_by_vert.append(list())
             for j in range(norm_counts[i]):
                 #vert_norms[i].append(unpack_vector(bin_data.read(12)))
                 this_norm = unpack_vector(bin_data.read(12))
-                if this_norm not in vert_norms:
+                if this_norm not in norm_idx:
+                    norm_idx[this_norm] = len(vert_norms)
                     vert_norms.append(this_norm)
-                    vnorms_by_vert[i].append(len(vert_norms) - 1)
-                else:
-                    vnorms_by_vert[i].append(vert_norms.index(this_norm))
+                vnorms_by_vert[i].append(norm_idx[this_norm])
                 #vert_norms.append(unpack_vector(bin_data.read(12)))
 
         self.vert_list = vert_list
@@ -2453,8 +3128,8 @@ class DefpointsBlock(POFChunk):
     def __len__(self):
         chunk_length = 20
         try:
-            vert_norms = self.vert_norms
-            for v in vert_norms:
+            vnorms_by_vert = self.vnorms_by_vert
+            for v in vnorms_by_vert:
                 chunk_length += 13 + 12 * len(v)
             return chunk_length
         except AttributeError:
@@ -2462,6 +3137,7 @@ class DefpointsBlock(POFChunk):
 
 
 class FlatpolyBlock(POFChunk):
+    __slots__ = ('normal', 'center', 'radius', 'color', 'vert_list', 'norm_list')
     CHUNK_ID = 2
     def read_chunk(self, bin_data):
         self.normal = unpack_vector(bin_data.read(12))
@@ -2506,13 +3182,14 @@ class FlatpolyBlock(POFChunk):
     def __len__(self):
         chunk_length = 44
         try:
-            chunk_length += 4 * len(vert_list)
+            chunk_length += 4 * len(self.vert_list)
             return chunk_length
         except AttributeError:
             return 0
 
 
 class TexpolyBlock(POFChunk):
+    __slots__ = ('normal', 'center', 'radius', 'texture_id', 'vert_list', 'norm_list', 'u', 'v')
     CHUNK_ID = 3
     def read_chunk(self, bin_data):
         self.normal = unpack_vector(bin_data.read(12))
@@ -2574,11 +3251,16 @@ class TexpolyBlock(POFChunk):
 
 
 class SortnormBlock(POFChunk):
+    __slots__ = ('plane_normal', 'plane_point', 'front_offset', 'back_offset',
+                 'prelist_offset', 'postlist_offset', 'online_offset', 'min', 'max')
     CHUNK_ID = 4
-    front_offset = 104
-    prelist_offset = 80
-    postlist_offset = 88
-    online_offset = 96
+    def __init__(self, pof_ver=2117, chunk_id=4):
+        self.pof_ver = pof_ver
+        self.front_offset = 104
+        self.prelist_offset = 80
+        self.postlist_offset = 88
+        self.online_offset = 96
+
     def read_chunk(self, bin_data):
         self.plane_normal = unpack_vector(bin_data.read(12))
         self.plane_point = unpack_vector(bin_data.read(12))
@@ -2613,6 +3295,7 @@ class SortnormBlock(POFChunk):
 
 
 class BoundboxBlock(POFChunk):
+    __slots__ = ('min', 'max')
     CHUNK_ID = 5
     def read_chunk(self, bin_data):
         self.min = unpack_vector(bin_data.read(12))
@@ -2622,7 +3305,7 @@ class BoundboxBlock(POFChunk):
         chunk = [pack_int(self.CHUNK_ID),
                       pack_int(32),
                       pack_float(self.min),
-                      pack_float(self.min)]
+                      pack_float(self.max)]
         return b"".join(chunk)
 
     def __len__(self):
@@ -2680,6 +3363,200 @@ chunk_order = {
                "PINF": 15}
 
 
+## BSP helpers ##
+
+
+# Below this many faces, a parallel build isn't worth starting processes for
+BSP_PARALLEL_MIN_FACES = 2000
+
+_bsp_worker_verts = None
+
+
+def _init_bsp_worker(vert_list):
+    global _bsp_worker_verts
+    _bsp_worker_verts = vert_list
+
+
+def _build_bsp_subtree(face_list):
+    """Worker process entry point.  Builds the subtree for face_list and
+    returns it as a list of blocks, sortnorm offsets relative to each sortnorm."""
+    chunk = ModelChunk()
+    chunk._defpoints = DefpointsBlock()
+    chunk._defpoints.vert_list = _bsp_worker_verts
+    chunk.bsp_tree = list()
+    chunk._generate_tree_recursion(face_list)
+    _set_bsp_offsets(chunk.bsp_tree)
+    return chunk.bsp_tree
+
+
+def _set_bsp_offsets(bsp_tree, idx=0):
+    """Fills in sortnorm back offsets for the subtree starting at bsp_tree[idx],
+    laid out the way ModelChunk builds it.  Returns the index after the
+    subtree and the subtree's size in bytes."""
+    node = bsp_tree[idx]
+    if node.CHUNK_ID == 4:
+        # sortnorm, then prelist, postlist and online end blocks,
+        # then the front subtree and the back subtree
+        size = len(node) + 24
+        idx, front_size = _set_bsp_offsets(bsp_tree, idx + 4)
+        size += front_size
+        node.back_offset = size
+        idx, back_size = _set_bsp_offsets(bsp_tree, idx)
+        return idx, size + back_size
+    # leaf: bounding box and polys up to an end block
+    size = 0
+    while node.CHUNK_ID != 0:
+        size += len(node)
+        idx += 1
+        node = bsp_tree[idx]
+    return idx + 1, size + len(node)
+
+
+class PolygonBuffer:
+    """
+    All the polygons of a submodel's BSP data in flat arrays, instead of a
+    FlatpolyBlock or TexpolyBlock each
+
+    Per polygon:
+    offsets - offset of the polygon's block in the BSP data
+    normals, centers - flat arrays, three floats per polygon
+    radii - polygon radii
+    texture_ids - texture ids, -1 for flat polygons
+    colors - flat array, four bytes (r, g, b, pad) per polygon, zero
+        for textured polygons
+    starts - offsets into the per-corner arrays for each polygon, plus
+        the total number of corners at the end
+
+    Per corner:
+    vert_ids, norm_ids - indices into the defpoints' verts and normals
+    u, v - texture coords, zero for flat polygons
+
+    Methods:
+    from_bsp_data(bsp_data) - Unpacks the polygons straight from packed BSP data
+    from_bsp_tree(bsp_tree) - Copies the polygons out of a list of blocks
+    append_block(block, offset) - Adds a FlatpolyBlock or TexpolyBlock
+    get_block(i) - Returns polygon i as a FlatpolyBlock or TexpolyBlock
+    """
+    def __init__(self):
+        self.offsets = array('i')
+        self.normals = array('f')
+        self.centers = array('f')
+        self.radii = array('f')
+        self.texture_ids = array('i')
+        self.colors = array('B')
+        self.starts = array('i', [0])
+        self.vert_ids = array('H')
+        self.norm_ids = array('H')
+        self.u = array('f')
+        self.v = array('f')
+
+    def __len__(self):
+        return len(self.radii)
+
+    def __repr__(self):
+        return "<PolygonBuffer of {} polygons and {} corners>".format(len(self), len(self.vert_ids))
+
+    @classmethod
+    def from_bsp_data(cls, bsp_data):
+        polys = cls()
+        size = len(bsp_data)
+        addr = 0
+        while addr + 8 <= size:
+            block_id, block_size = unpack_from('<ii', bsp_data, addr)
+            if block_id == 2 or block_id == 3:
+                normal = unpack_from('<3f', bsp_data, addr + 8)
+                center = unpack_from('<3f', bsp_data, addr + 20)
+                radius, num_verts = unpack_from('<fi', bsp_data, addr + 32)
+                polys.offsets.append(addr)
+                polys.normals.extend(normal)
+                polys.centers.extend(center)
+                polys.radii.append(radius)
+                if block_id == 2:
+                    polys.texture_ids.append(-1)
+                    polys.colors.extend(unpack_from('<4B', bsp_data, addr + 40))
+                    corners = unpack_from('<{}H'.format(2 * num_verts), bsp_data, addr + 44)
+                    polys.vert_ids.extend(corners[0::2])
+                    polys.norm_ids.extend(corners[1::2])
+                    polys.u.extend([0.0] * num_verts)
+                    polys.v.extend([0.0] * num_verts)
+                else:
+                    polys.texture_ids.append(unpack_from('<i', bsp_data, addr + 40)[0])
+                    polys.colors.extend((0, 0, 0, 0))
+                    corners = unpack_from('<' + 'HHff' * num_verts, bsp_data, addr + 44)
+                    polys.vert_ids.extend(corners[0::4])
+                    polys.norm_ids.extend(corners[1::4])
+                    polys.u.extend(corners[2::4])
+                    polys.v.extend(corners[3::4])
+                polys.starts.append(len(polys.vert_ids))
+            if block_size <= 0:
+                # end block, or garbage
+                block_size = 8
+            addr += block_size
+        return polys
+
+    @classmethod
+    def from_bsp_tree(cls, bsp_tree):
+        polys = cls()
+        addr = 0
+        for block in bsp_tree:
+            if block.CHUNK_ID == 2 or block.CHUNK_ID == 3:
+                polys.append_block(block, addr)
+            addr += len(block)
+        return polys
+
+    def append_block(self, block, offset=-1):
+        num_verts = len(block.vert_list)
+        self.offsets.append(offset)
+        self.normals.extend(block.normal)
+        self.centers.extend(block.center)
+        self.radii.append(block.radius)
+        self.vert_ids.extend(block.vert_list)
+        self.norm_ids.extend(block.norm_list)
+        if block.CHUNK_ID == 2:
+            self.texture_ids.append(-1)
+            color = block.color
+            if isinstance(color, int):
+                color = (color, 0, 0, 0)
+            self.colors.extend(color)
+            self.u.extend([0.0] * num_verts)
+            self.v.extend([0.0] * num_verts)
+        else:
+            self.texture_ids.append(block.texture_id)
+            self.colors.extend((0, 0, 0, 0))
+            self.u.extend(block.u)
+            self.v.extend(block.v)
+        self.starts.append(len(self.vert_ids))
+
+    def get_block(self, i):
+        first = self.starts[i]
+        last = self.starts[i + 1]
+        if self.texture_ids[i] < 0:
+            block = FlatpolyBlock()
+            block.color = tuple(self.colors[4 * i:4 * i + 4])
+        else:
+            block = TexpolyBlock()
+            block.texture_id = self.texture_ids[i]
+            block.u = self.u[first:last].tolist()
+            block.v = self.v[first:last].tolist()
+        block.normal = tuple(self.normals[3 * i:3 * i + 3])
+        block.center = tuple(self.centers[3 * i:3 * i + 3])
+        block.radius = self.radii[i]
+        block.vert_list = self.vert_ids[first:last].tolist()
+        block.norm_list = self.norm_ids[first:last].tolist()
+        return block
+
+
+def index_bsp_tree(bsp_tree):
+    """Returns a dict mapping the offset of each block within the packed BSP
+    data to its index in bsp_tree, and the total size of the packed data."""
+    offsets = dict()
+    addr = 0
+    for i, block in enumerate(bsp_tree):
+        offsets[addr] = i
+        addr += len(block)
+    return offsets, addr
+
+
 ## Module methods ##
 
 
@@ -2730,7 +3607,7 @@ def write_pof(polymodel, pof_version=2117):
     pof_file = b"".join([b'PSPO', pack_int(pof_version)])
 
     for chunk in chunk_list:
-        print("Writing chunk {}".format(chunk.CHUNK_ID))
+        logging.debug("Writing chunk {}".format(chunk.CHUNK_ID))
         pof_file += chunk.write_chunk()
 
     return pof_file
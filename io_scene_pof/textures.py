@@ -0,0 +1,188 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+## Texture resolver module
+## Copyright (c) 2012 by Christopher Koch
+
+"""This module contains TextureResolver, which finds texture files by name in a list of search directories and VP archives without caring about case or extension, the way the engine does."""
+
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
+
+# in the order the engine tries them
+TEXTURE_EXTENSIONS = (b'.dds', b'.tga', b'.png', b'.jpg', b'.pcx')
+
+# Magic numbers by extension.  TGA doesn't have one.
+_HEADERS = {b'.dds': (b'DDS ',),
+            b'.png': (b'\x89PNG',),
+            b'.jpg': (b'\xff\xd8\xff',),
+            b'.pcx': (b'\x0a',),
+            }
+
+# Directory indexes kept for the session, keyed by path.  Each entry holds
+# the directory's mtime so an index is rebuilt when files are added.
+_dir_cache = dict()
+
+# file_fingerprint() results, keyed by (path, size, mtime)
+_fingerprint_cache = dict()
+
+
+def _index_dir(path):
+    """Returns a dict of lowercase name without extension : dict of lowercase
+    extension : path for the texture files in directory path."""
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return dict()
+    cached = _dir_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    index = dict()
+    for name in os.listdir(path):
+        base, ext = os.path.splitext(name)
+        ext = ext.lower()
+        if ext not in TEXTURE_EXTENSIONS:
+            continue
+        index.setdefault(base.lower(), dict())[ext] = os.path.join(path, name)
+    logging.debug("Indexed {} textures in {}".format(len(index), path))
+    _dir_cache[path] = (mtime, index)
+    return index
+
+
+def _index_archive(archive):
+    """Like _index_dir(), but for the members of a VPArchive.  Paths are member
+    paths inside the archive."""
+    index = dict()
+    for member in archive.namelist():
+        base, ext = os.path.splitext(member.rsplit(b'/', 1)[-1])
+        if ext not in TEXTURE_EXTENSIONS:
+            continue
+        # the first one in the archive wins, like the engine
+        index.setdefault(base, dict()).setdefault(ext, member)
+    return index
+
+
+def _header_ok(path, head):
+    magics = _HEADERS.get(os.path.splitext(path)[1].lower())
+    if magics is None:
+        return len(head) > 0
+    return head.startswith(magics)
+
+
+def check_header(path):
+    """Returns True if the file at path starts with the magic number for its
+    extension, or if the format doesn't have one."""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(4)
+    except (IOError, OSError):
+        return False
+    return _header_ok(path, head)
+
+
+def file_fingerprint(path):
+    """Returns a hex digest of the contents of the file at path.  Digests are
+    cached for the session by path, size and mtime."""
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime)
+    fingerprint = _fingerprint_cache.get(key)
+    if fingerprint is None:
+        h = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        fingerprint = h.hexdigest()
+        _fingerprint_cache[key] = fingerprint
+    return fingerprint
+
+
+def clear_cache():
+    """Forgets all directory indexes and fingerprints built this session."""
+    _dir_cache.clear()
+    _fingerprint_cache.clear()
+
+
+class TextureResolver:
+
+    """Finds texture files in a list of directories and VP archives.  Each directory is listed once and indexed by lowercase name; directories earlier in the list take precedence, and loose files take precedence over archives.  Paths are bytes, like the texture names in a TXTR chunk.
+
+    Methods:
+        find(name) -- Returns candidates for texture name, best first.  Each is a path, or (VPArchive, member path) for archived textures.
+        resolve(names) -- Returns a list of paths (or None) for each name, with headers checked concurrently.  Archived textures are extracted so Blender can load them."""
+
+    def __init__(self, search_dirs, preferred_ext=None, jobs=None, archives=()):
+        self.search_dirs = [os.path.normpath(d) for d in search_dirs]
+        extensions = list(TEXTURE_EXTENSIONS)
+        if preferred_ext is not None:
+            preferred_ext = preferred_ext.lower()
+            if preferred_ext in extensions:
+                extensions.remove(preferred_ext)
+            extensions.insert(0, preferred_ext)
+        self.extensions = extensions
+        if jobs is None:
+            jobs = min(8, cpu_count() * 2)
+        self.jobs = jobs
+        self._indexes = [_index_dir(d) for d in self.search_dirs if os.path.isdir(d)]
+        self._archives = [(a, _index_archive(a)) for a in archives]
+
+    def __repr__(self):
+        return "<TextureResolver over {} directories and {} archives>".format(
+            len(self._indexes), len(self._archives))
+
+    def find(self, name):
+        name = name.lower()
+        base, ext = os.path.splitext(name)
+        if ext in TEXTURE_EXTENSIONS:
+            name = base
+        candidates = list()
+        for index in self._indexes:
+            found = index.get(name)
+            if found is None:
+                continue
+            for ext in self.extensions:
+                if ext in found:
+                    candidates.append(found[ext])
+        for archive, index in self._archives:
+            found = index.get(name)
+            if found is None:
+                continue
+            for ext in self.extensions:
+                if ext in found:
+                    candidates.append((archive, found[ext]))
+        return candidates
+
+    def _first_valid(self, candidates):
+        for path in candidates:
+            if isinstance(path, tuple):
+                archive, member = path
+                if _header_ok(member, archive.read(member)[:4].tobytes()):
+                    return archive.extract(member)
+            elif check_header(path):
+                return path
+            logging.warning("Skipping texture {} with a bad header".format(path))
+        return None
+
+    def resolve(self, names):
+        candidates = [self.find(name) for name in names]
+        if self.jobs > 1 and len(names) > 1:
+            with ThreadPoolExecutor(self.jobs) as executor:
+                return list(executor.map(self._first_valid, candidates))
+        return [self._first_valid(c) for c in candidates]
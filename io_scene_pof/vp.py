@@ -0,0 +1,233 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 3
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+## VP archive module
+## Copyright (c) 2012 by Christopher Koch
+
+"""This module contains VPArchive, a reader for Volition package (.vp) files that serves its members straight out of a memory map."""
+
+import atexit
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from struct import unpack_from
+from .bintools import RawData
+from .pof import FileFormatError
+
+VP_HEADER_SIZE = 16
+VP_ENTRY_SIZE = 44
+
+# members extracted for things that need a real file, like
+# bpy.data.images.load().  Removed when Python exits.
+_extract_dir = None
+_extract_lock = threading.Lock()
+# what extract() wrote where this session: destination path : (archive
+# path, offset, size, timestamp) of the member it holds
+_extracted = dict()
+
+
+def _get_extract_dir():
+    global _extract_dir
+    with _extract_lock:
+        if _extract_dir is None:
+            _extract_dir = os.fsencode(tempfile.mkdtemp(prefix="io_scene_pof_vp_"))
+            atexit.register(shutil.rmtree, _extract_dir, True)
+    return _extract_dir
+
+
+def is_extracted(path):
+    """Returns True if path is a file extract() wrote to the temporary
+    directory, which goes away when Python exits."""
+    if _extract_dir is None:
+        return False
+    if isinstance(path, str):
+        path = os.fsencode(path)
+    path = os.path.abspath(path)
+    return path.startswith(os.path.join(_extract_dir, b''))
+
+
+def split_vp_path(path):
+    """Splits a path like /mods/mv_models.vp/data/models/ship.pof into the
+    archive path and the member path inside it.  Returns (path, None) if no
+    component of path is an existing .vp file."""
+    if isinstance(path, str):
+        path = os.fsencode(path)
+    parts = path.replace(b'\\', b'/').split(b'/')
+    for i in range(1, len(parts)):
+        if not parts[i - 1].lower().endswith(b'.vp'):
+            continue
+        archive_path = b'/'.join(parts[:i])
+        if os.path.isfile(archive_path):
+            return archive_path, b'/'.join(parts[i:])
+    return path, None
+
+
+class VPEntry:
+
+    """A file in a VP archive.  path is the lowercase path inside the archive, with / separators."""
+
+    __slots__ = ('path', 'offset', 'size', 'timestamp')
+
+    def __init__(self, path, offset, size, timestamp):
+        self.path = path
+        self.offset = offset
+        self.size = size
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return "<VPEntry {} of {} bytes at {}>".format(self.path, self.size, self.offset)
+
+
+class VPArchive:
+
+    """A memory-mapped VP archive.  The directory table is read once into an index of lowercase path : VPEntry.  Member data is served as memoryview slices of the map, so nothing is copied until it's read.
+
+    Methods:
+        namelist() -- Returns the paths of all files in the archive.
+        getinfo(path) -- Returns the VPEntry for path.  Raises KeyError if there isn't one.
+        read(path) -- Returns a memoryview of the member's data.
+        open(path) -- Returns a RawData over the member, for pof.read_pof().
+        listdir(path) -- Returns the paths of files directly under directory path.
+        extract(path[, dest_dir]) -- Writes the member to a file and returns its path.
+        close() -- Unmaps the archive."""
+
+    def __init__(self, path):
+        if isinstance(path, str):
+            path = os.fsencode(path)
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:      # empty file
+            self._file.close()
+            raise FileFormatError(path, "Empty VP archive")
+        self._view = memoryview(self._map)
+        self.index = dict()
+        self._read_index()
+
+    def __repr__(self):
+        return "<VPArchive {} with {} files>".format(self.path, len(self.index))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, path):
+        return self._key(path) in self.index
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read_index(self):
+        if len(self._map) < VP_HEADER_SIZE or self._map[:4] != b'VPVP':
+            raise FileFormatError(self._map[:4], "Incorrect file ID for VP archive")
+        version, dir_offset, num_entries = unpack_from('<3i', self._map, 4)
+        if version > 2:
+            logging.warning("Unknown VP version {}, reading anyway".format(version))
+        if dir_offset + num_entries * VP_ENTRY_SIZE > len(self._map):
+            raise FileFormatError(dir_offset, "VP directory runs past end of archive, offset")
+
+        # like the engine, any entry of size 0 opens a directory and '..'
+        # closes the last one
+        dir_stack = list()
+        addr = dir_offset
+        for i in range(num_entries):
+            offset, size = unpack_from('<2i', self._map, addr)
+            name = self._map[addr + 8:addr + 40].split(b'\0', 1)[0].lower()
+            timestamp = unpack_from('<i', self._map, addr + 40)[0]
+            addr += VP_ENTRY_SIZE
+            if name == b'..':
+                if dir_stack:
+                    dir_stack.pop()
+            elif size == 0:
+                dir_stack.append(name)
+            else:
+                path = b'/'.join(dir_stack + [name])
+                if offset + size > len(self._map):
+                    logging.warning("Skipping {}, which runs past the end of the archive".format(path))
+                    continue
+                self.index[path] = VPEntry(path, offset, size, timestamp)
+        logging.info("Indexed {} files in {}".format(len(self.index), self.path))
+
+    def _key(self, path):
+        if isinstance(path, str):
+            path = path.encode('ascii')
+        return path.replace(b'\\', b'/').strip(b'/').lower()
+
+    def namelist(self):
+        return list(self.index)
+
+    def getinfo(self, path):
+        return self.index[self._key(path)]
+
+    def read(self, path):
+        entry = self.getinfo(path)
+        return self._view[entry.offset:entry.offset + entry.size]
+
+    def open(self, path):
+        return RawData(self.read(path))
+
+    def listdir(self, path=b''):
+        prefix = self._key(path)
+        if prefix:
+            prefix += b'/'
+        return [p for p in self.index if p.startswith(prefix) and b'/' not in p[len(prefix):]]
+
+    def extract(self, path, dest_dir=None):
+        entry = self.getinfo(path)
+        archive_path = os.path.normcase(os.path.abspath(self.path))
+        if dest_dir is None:
+            # mods often ship archives with the same name, so the name alone
+            # doesn't tell them apart
+            archive_id = hashlib.sha1(archive_path).hexdigest()[:12].encode()
+            dest_dir = os.path.join(_get_extract_dir(),
+                                    os.path.basename(self.path) + b'-' + archive_id)
+        dest_path = os.path.join(dest_dir, *entry.path.split(b'/'))
+        # archives don't change under us often; don't rewrite what's there
+        # if it came from this very entry
+        source = (archive_path, entry.offset, entry.size, entry.timestamp)
+        with _extract_lock:
+            reuse = _extracted.get(dest_path) == source
+        if reuse and os.path.isfile(dest_path) and os.path.getsize(dest_path) == entry.size:
+            return dest_path
+        # textures are extracted from several threads at once; nobody
+        # should see a half written file, or trip over a directory another
+        # thread just made
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        tmp_path = dest_path + ".{}.{}.tmp".format(os.getpid(), threading.get_ident()).encode()
+        with open(tmp_path, 'wb') as f:
+            f.write(self.read(path))
+        os.replace(tmp_path, dest_path)
+        with _extract_lock:
+            _extracted[dest_path] = source
+        return dest_path
+
+    def close(self):
+        self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            # someone still holds a member view; the map goes when they do
+            logging.debug("{} still has views open, leaving it mapped".format(self.path))
+        self._file.close()